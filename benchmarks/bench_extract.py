@@ -0,0 +1,158 @@
+"""
+Нагрузочный замер загрузчика на локальной замене ISS
+
+MOEXDataCollector загружает историю с сервера benchmarks/iss_stub.py при
+разных уровнях параллельности. Для каждого прогона печатаются запросы
+в секунду, общее время, число повторов и ответов 429/503, а загруженные
+строки и число успешных запросов сверяются с данными сервера (проверка
+постраничной загрузки). По умолчанию прогоны идут для 250 и 300 дней:
+при 300 строках на бумагу история кратна размеру страницы и загрузка
+заканчивается пустой страницей.
+
+Запуск: python benchmarks/bench_extract.py [--securities=30] [--days=250,300]
+        [--concurrency=1,4,8,16] [--rps=50] [--latency=0.02] [--error-rate=0.01]
+        [--rate-limit=40] [--strategy=ticker] [--output=результат.json]
+"""
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.iss_stub import StubISS
+from flows.extract_moex import MOEXDataCollector
+
+
+CONCURRENCY = [1, 4, 8, 16]
+# 300 строк - ровно три страницы по PAGE_SIZE, четвертая приходит пустой
+DAYS = [250, 300]
+
+
+def expected_rows(stub, secids, start_date, end_date):
+    df = stub.history
+    mask = df['SECID'].isin(secids) & (df['TRADEDATE'] >= start_date) & (df['TRADEDATE'] <= end_date)
+    return int(mask.sum())
+
+
+def expected_requests(stub, strategy, secids, start_date, end_date):
+    """
+    Число страниц, которые загрузчик должен получить
+    
+    Последняя страница серии короче PAGE_SIZE; если строк ровно кратно
+    PAGE_SIZE, нужна еще одна - пустая. По тикерам серия - история бумаги,
+    по датам - снимок режима за каждый календарный день.
+    """
+    df = stub.history
+    df = df[(df['TRADEDATE'] >= start_date) & (df['TRADEDATE'] <= end_date)]
+    if strategy == 'date':
+        counts = df.groupby('TRADEDATE').size()
+        dates = pd.date_range(start_date, end_date, freq='D').strftime('%Y-%m-%d')
+        sizes = [int(counts.get(date, 0)) for date in dates]
+    else:
+        counts = df[df['SECID'].isin(secids)].groupby('SECID').size()
+        sizes = [int(counts.get(secid, 0)) for secid in secids]
+    
+    return sum(size // stub.PAGE_SIZE + 1 for size in sizes)
+
+
+def run_once(stub, concurrency, requests_per_second, strategy='ticker', backoff_base=0.05):
+    """Одна загрузка всех бумаг сервера: метрики прогона"""
+    collector = MOEXDataCollector(
+        max_concurrency=concurrency,
+        requests_per_second=requests_per_second,
+        backoff_base=backoff_base,
+        backoff_cap=2,
+        strategy=strategy
+    )
+    collector.BASE_URL = stub.url
+    
+    dates = stub.history['TRADEDATE']
+    start_date, end_date = dates.min(), dates.max()
+    server_before = dict(stub.stats)
+    
+    start = time.perf_counter()
+    df = collector.collect_multiple_securities(stub.secids, start_date, end_date)
+    seconds = time.perf_counter() - start
+    
+    server = {key: stub.stats[key] - server_before[key] for key in stub.stats}
+    expected = expected_rows(stub, stub.secids, start_date, end_date)
+    pages = expected_requests(stub, strategy, stub.secids, start_date, end_date)
+    
+    return {
+        'concurrency': concurrency,
+        'strategy': strategy,
+        'seconds': round(seconds, 3),
+        'requests': collector.request_count,
+        'requests_per_second': round(collector.request_count / seconds, 1) if seconds else None,
+        'retries': collector.retry_count,
+        'throttled': server['throttled'],
+        'errors': server['errors'],
+        'rows': len(df),
+        'expected_rows': expected,
+        'pages': server['ok'],
+        'expected_pages': pages,
+        # Все строки загружены, лишних и пропущенных страниц нет,
+        # а счетчик загрузчика совпадает с запросами, дошедшими до сервера
+        'complete': len(df) == expected and server['ok'] == pages
+                    and collector.request_count == server['requests'],
+    }
+
+
+def run(n_securities=30, n_days=250, concurrency=CONCURRENCY, requests_per_second=50,
+        latency=0.02, error_rate=0.01, rate_limit=None, strategy='ticker'):
+    """Прогоны для каждого уровня параллельности на одном сервере"""
+    with StubISS(n_securities, n_days, latency=latency, error_rate=error_rate,
+                 rate_limit=rate_limit) as stub:
+        results = []
+        for level in concurrency:
+            result = run_once(stub, level, requests_per_second, strategy)
+            results.append(result)
+            print(f"параллельно {level:>3}: {result['seconds']:7.2f} с, "
+                  f"{result['requests_per_second']:7.1f} запр/с, повторов {result['retries']:>4} "
+                  f"(429: {result['throttled']}, 503: {result['errors']}), "
+                  f"строк {result['rows']}/{result['expected_rows']}, "
+                  f"страниц {result['pages']}/{result['expected_pages']}")
+    
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'server': {
+            'securities': n_securities,
+            'days': n_days,
+            'latency': latency,
+            'error_rate': error_rate,
+            'rate_limit': rate_limit,
+        },
+        'requests_per_second_limit': requests_per_second,
+        'results': results,
+    }
+
+
+if __name__ == "__main__":
+    args = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    
+    reports = []
+    for n_days in ([int(x) for x in args['days'].split(',')] if 'days' in args else DAYS):
+        print(f"📅 {n_days} дней")
+        reports.append(run(
+            n_securities=int(args.get('securities', 30)),
+            n_days=n_days,
+            concurrency=[int(x) for x in args['concurrency'].split(',')] if 'concurrency' in args else CONCURRENCY,
+            requests_per_second=float(args.get('rps', 50)),
+            latency=float(args.get('latency', 0.02)),
+            error_rate=float(args.get('error-rate', 0.01)),
+            rate_limit=float(args['rate-limit']) if 'rate-limit' in args else None,
+            strategy=args.get('strategy', 'ticker')
+        ))
+    
+    if 'output' in args:
+        with open(args['output'], 'w', encoding='utf-8') as f:
+            json.dump(reports, f, ensure_ascii=False, indent=2)
+        print(f"✅ Результаты: {args['output']}")
+    
+    if not all(result['complete'] for report in reports for result in report['results']):
+        print("❌ Загружены не все строки или число запросов не совпадает с сервером")
+        sys.exit(1)
+    print("✅ Все строки загружены")
@@ -0,0 +1,66 @@
+"""
+Сравнение векторного расчета индикаторов с прежним groupby().apply()
+
+Запуск: python benchmarks/bench_indicators.py [число акций] [число дней]
+"""
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+from dask_jobs.indicators import compute_indicators, INDICATOR_COLUMNS
+
+
+def calculate_for_security(group):
+    """Прежняя реализация (до векторного движка) - эталон для сравнения"""
+    group = group.sort_values('TRADEDATE')
+    
+    group['DAILY_RETURN'] = group['CLOSE'].pct_change() * 100
+    group['MA_7'] = group['CLOSE'].rolling(window=7, min_periods=1).mean()
+    group['MA_30'] = group['CLOSE'].rolling(window=30, min_periods=1).mean()
+    group['VOLATILITY_7'] = group['DAILY_RETURN'].rolling(window=7, min_periods=1).std()
+    group['VOLUME_CHANGE'] = group['VOLUME'].pct_change() * 100
+    
+    return group
+
+
+def make_history(n_securities, n_days, seed=0):
+    """Синтетическая история, уже очищенная и отсортированная как после clean_data"""
+    df = synthetic.make_history(n_securities, n_days, seed=seed)
+    df['TRADEDATE'] = pd.to_datetime(df['TRADEDATE'])
+    return df[['TRADEDATE', 'SECID', 'OPEN', 'HIGH', 'LOW', 'CLOSE', 'VOLUME']]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def run(n_securities, n_days):
+    df = make_history(n_securities, n_days)
+    
+    legacy, legacy_time = timed(
+        lambda d: d.groupby('SECID', group_keys=False).apply(calculate_for_security), df
+    )
+    vectorized, vectorized_time = timed(compute_indicators, df)
+    
+    pd.testing.assert_frame_equal(legacy, vectorized, check_exact=True)
+    
+    print(f"{n_securities:>6} акций x {n_days:>5} дней: "
+          f"groupby.apply {legacy_time:8.3f} с, векторно {vectorized_time:8.3f} с, "
+          f"ускорение x{legacy_time / vectorized_time:.1f}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3:
+        run(int(sys.argv[1]), int(sys.argv[2]))
+    else:
+        for n_securities, n_days in [(30, 250), (300, 1250), (3000, 1250)]:
+            run(n_securities, n_days)
+    
+    print(f"✅ Результаты совпадают: {', '.join(INDICATOR_COLUMNS)}")
@@ -0,0 +1,223 @@
+"""
+Бенчмарк MOEXDataProcessor на синтетических данных
+
+Для каждой точки масштаба (число акций x число лет) генерируется сырой
+датасет (benchmarks/synthetic.py), и в каждом режиме замеряются время
+и пиковая память процесса (RSS) этапов clean_data, calculate_indicators,
+aggregate_weekly и save_results. Результаты пишутся в JSON; --compare
+сравнивает их с прошлым прогоном и печатает замедлившиеся этапы.
+
+Режимы: pandas, dask (локальный планировщик вне памяти), cluster
+(LocalCluster или --scheduler=адрес), а также processes и local из
+dask_jobs.parallel. В режимах Dask этапы clean_data и calculate_indicators
+строят ленивый план, а save_results идет раньше aggregate_weekly, как
+в пайплайне: план считается при сохранении, и воркеры пишут свои партиции
+сами, не собирая дневную таблицу на клиенте.
+В режиме cluster память - только клиентского процесса.
+
+Запуск: python benchmarks/bench_transform.py [--scales=30x1,300x5]
+        [--modes=pandas,dask,cluster] [--output=результат.json]
+        [--compare=прошлый.json] [--scheduler=localhost:8786]
+"""
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import dask
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+from dask_jobs import parallel
+from dask_jobs.metrics import PeakRSS
+from dask_jobs.transform import MOEXDataProcessor
+
+
+# Точки масштаба: (число акций, число лет)
+SCALES = [(n, years) for n in (30, 300, 3000) for years in (1, 5, 20)]
+MODES = ['pandas', 'dask', 'cluster']
+STAGES = ['clean_data', 'calculate_indicators', 'aggregate_weekly', 'save_results']
+# В режимах Dask план считается при сохранении (запись на воркерах)
+DASK_STAGES = ['clean_data', 'calculate_indicators', 'save_results', 'aggregate_weekly']
+
+# Доли пропусков и дубликатов в синтетических данных
+GAP_RATE = 0.02
+EMPTY_RATE = 0.01
+DUPLICATE_RATE = 0.01
+
+# Этап считается замедлившимся, если стал дольше прошлого в это число раз
+REGRESSION_FACTOR = 1.2
+
+
+def measure(func):
+    """Время (с) и пиковая память (МБ) вызова func()"""
+    with PeakRSS() as rss:
+        start = time.perf_counter()
+        func()
+        seconds = time.perf_counter() - start
+    
+    return {'seconds': round(seconds, 4), 'peak_rss_mb': round(rss.peak_mb, 1)}
+
+
+def make_processor(raw_path, mode, scheduler_address):
+    if mode == 'cluster':
+        return MOEXDataProcessor(raw_path, use_dask_cluster=True, scheduler_address=scheduler_address)
+    return MOEXDataProcessor(raw_path, mode=mode)
+
+
+def run_point(workdir, n_securities, years, mode, scheduler_address=None):
+    """Замер всех этапов одной точки масштаба в одном режиме"""
+    raw_path = os.path.join(workdir, 'raw')
+    output = os.path.join(workdir, f"daily_{mode}")
+    
+    processor = make_processor(raw_path, mode, scheduler_address)
+    stages = {
+        'clean_data': processor.clean_data,
+        'calculate_indicators': processor.calculate_indicators,
+        'aggregate_weekly': processor.aggregate_weekly,
+        'save_results': lambda: processor.save_results(output),
+    }
+    
+    order = DASK_STAGES if processor.use_dask else STAGES
+    
+    result = {
+        'securities': n_securities,
+        'years': years,
+        'mode': mode,
+        'resolved_mode': processor.mode,
+        'stages': {stage: measure(stages[stage]) for stage in order},
+    }
+    result['rows'] = int(processor.get_statistics()['total_rows'])
+    result['total_seconds'] = round(sum(s['seconds'] for s in result['stages'].values()), 4)
+    
+    processor.close()
+    shutil.rmtree(output, ignore_errors=True)
+    return result
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def machine_info():
+    cores, memory_mb = parallel.machine_resources()
+    return {
+        'cores': cores,
+        'memory_available_mb': round(memory_mb),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'dask': dask.__version__,
+        'platform': platform.platform(),
+    }
+
+
+def run(scales=SCALES, modes=MODES, scheduler_address=None):
+    """Прогон всех точек и режимов: словарь для JSON"""
+    cluster = None
+    if 'cluster' in modes and scheduler_address is None:
+        cores, memory_mb = parallel.machine_resources()
+        cluster = parallel.start_local_cluster(cores, memory_mb)
+        scheduler_address = cluster.scheduler_address
+    
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': git_revision(),
+        'machine': machine_info(),
+        'results': [],
+    }
+    
+    try:
+        for n_securities, years in scales:
+            workdir = tempfile.mkdtemp(prefix='bench_transform_')
+            try:
+                raw_rows = synthetic.write_raw_dataset(
+                    os.path.join(workdir, 'raw'),
+                    n_securities,
+                    years * synthetic.TRADING_DAYS_PER_YEAR,
+                    gap_rate=GAP_RATE,
+                    empty_rate=EMPTY_RATE,
+                    duplicate_rate=DUPLICATE_RATE
+                )
+                
+                for mode in modes:
+                    result = run_point(workdir, n_securities, years, mode, scheduler_address)
+                    result['raw_rows'] = raw_rows
+                    report['results'].append(result)
+                    print(f"{n_securities:>5} акций x {years:>2} лет, {mode:>9}: "
+                          f"{result['total_seconds']:8.2f} с, "
+                          f"пик {max(s['peak_rss_mb'] for s in result['stages'].values()):8.0f} МБ")
+            finally:
+                shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        if cluster is not None:
+            cluster.close()
+    
+    return report
+
+
+def compare(previous, current, factor=REGRESSION_FACTOR):
+    """
+    Этапы, которые стали медленнее прошлого прогона больше чем в factor раз
+    
+    Возвращает список (акции, годы, режим, этап, было, стало).
+    """
+    key = lambda r: (r['securities'], r['years'], r['mode'])
+    before = {key(r): r for r in previous['results']}
+    
+    slower = []
+    for result in current['results']:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        for stage, timing in result['stages'].items():
+            was = old['stages'].get(stage, {}).get('seconds')
+            if was and timing['seconds'] > was * factor:
+                slower.append(key(result) + (stage, was, timing['seconds']))
+    
+    return slower
+
+
+def parse_scales(value):
+    """'30x1,300x5' -> [(30, 1), (300, 5)]"""
+    return [tuple(int(x) for x in point.split('x')) for point in value.split(',')]
+
+
+if __name__ == "__main__":
+    args = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--') and '=' in arg)
+    
+    scales = parse_scales(args['scales']) if 'scales' in args else SCALES
+    modes = args['modes'].split(',') if 'modes' in args else MODES
+    output = args.get('output', os.path.join(
+        'benchmarks', 'results', f"transform-{time.strftime('%Y%m%dT%H%M%S')}.json"
+    ))
+    
+    report = run(scales, modes, args.get('scheduler'))
+    
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"✅ Результаты: {output}")
+    
+    if 'compare' in args:
+        with open(args['compare'], encoding='utf-8') as f:
+            slower = compare(json.load(f), report)
+        for n_securities, years, mode, stage, was, now in slower:
+            print(f"⚠️ {n_securities} акций x {years} лет, {mode}, {stage}: {was:.2f} с -> {now:.2f} с")
+        if slower:
+            sys.exit(1)
+        print("✅ Замедлений нет")
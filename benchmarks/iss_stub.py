@@ -0,0 +1,220 @@
+"""
+Локальная замена ISS для замеров и проверки загрузчика без сети
+
+HTTP-сервер отдает синтетическую историю (benchmarks/synthetic.py) по тем же
+адресам и в том же формате JSON, что ISS, со страницами по 100 строк
+и блоком history.cursor:
+- /iss/history/engines/stock/markets/shares/boards/TQBR/securities/{SECID}.json
+  ?from=&till=&start= - история бумаги
+- /iss/history/engines/stock/markets/shares/boards/TQBR/securities.json
+  ?date=&start= - итоги всех бумаг режима за день
+- /iss/engines/stock/markets/shares/boards/TQBR/securities.json
+  - список бумаг и обороты текущей сессии (securities, marketdata)
+Задержка ответа, доля ошибок 5xx и лимит запросов в секунду (сверх
+лимита - 429 с Retry-After) настраиваются.
+
+Запуск: python benchmarks/iss_stub.py [число акций] [число дней] [порт]
+"""
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import synthetic
+
+
+HISTORY_PREFIX = '/iss/history/engines/stock/markets/shares/boards/TQBR/securities'
+MARKET_PATH = '/iss/engines/stock/markets/shares/boards/TQBR/securities.json'
+
+
+def iss_block(columns, rows):
+    """Блок ответа ISS: metadata, columns, data (NaN - null)"""
+    data = [[None if isinstance(v, float) and np.isnan(v) else v for v in row] for row in rows]
+    return {
+        'metadata': {col: {} for col in columns},
+        'columns': list(columns),
+        'data': data,
+    }
+
+
+class StubISS:
+    """
+    Сервер ISS на синтетических данных в отдельном потоке
+    
+    latency: задержка каждого ответа (сек)
+    error_rate: доля ответов 503
+    rate_limit: запросов в секунду, сверх - 429 (None - без лимита)
+    Счетчики запросов и ошибок - в stats.
+    """
+    
+    PAGE_SIZE = 100
+    
+    def __init__(self, n_securities=30, n_days=250, latency=0.0, error_rate=0.0, rate_limit=None,
+                 retry_after=1, port=0, seed=0, **history_kwargs):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        
+        df = synthetic.make_history(n_securities, n_days, seed=seed, **history_kwargs)
+        self.columns = list(df.columns)
+        self.secids = sorted(df['SECID'].unique())
+        self.history = df
+        self.by_secid = {secid: part for secid, part in df.groupby('SECID', sort=False)}
+        self.by_date = {date: part for date, part in df.groupby('TRADEDATE', sort=False)}
+        
+        self.stats = {'requests': 0, 'ok': 0, 'errors': 0, 'throttled': 0, 'not_found': 0}
+        self._lock = threading.Lock()
+        self._window = []
+        
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self._thread = None
+    
+    @property
+    def url(self):
+        """Адрес для MOEXDataCollector.BASE_URL"""
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/iss"
+    
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+    
+    def _throttled(self):
+        """Превышен ли лимит запросов за последнюю секунду"""
+        if not self.rate_limit:
+            return False
+        
+        now = time.monotonic()
+        with self._lock:
+            self._window = [t for t in self._window if now - t < 1.0]
+            if len(self._window) >= self.rate_limit:
+                return True
+            self._window.append(now)
+            return False
+    
+    def _page(self, rows, start):
+        """Страница history и курсор: строки [start, start + PAGE_SIZE)"""
+        page = rows.iloc[start:start + self.PAGE_SIZE]
+        return {
+            'history': iss_block(self.columns, page.itertuples(index=False, name=None)),
+            'history.cursor': iss_block(
+                ['INDEX', 'TOTAL', 'PAGESIZE'], [[start, len(rows), self.PAGE_SIZE]]
+            ),
+        }
+    
+    def security_history(self, secid, params):
+        rows = self.by_secid.get(secid, self.history.iloc[:0])
+        start, till = params.get('from'), params.get('till')
+        if start:
+            rows = rows[rows['TRADEDATE'] >= start]
+        if till:
+            rows = rows[rows['TRADEDATE'] <= till]
+        return self._page(rows, int(params.get('start', 0)))
+    
+    def board_history(self, params):
+        rows = self.by_date.get(params.get('date'), self.history.iloc[:0])
+        return self._page(rows, int(params.get('start', 0)))
+    
+    def market_data(self):
+        last = self.history.groupby('SECID', sort=True).last()
+        return {
+            'securities': iss_block(
+                ['SECID', 'SHORTNAME', 'STATUS'],
+                [[secid, row['SHORTNAME'], 'A'] for secid, row in last.iterrows()]
+            ),
+            'marketdata': iss_block(
+                ['SECID', 'VALTODAY'],
+                [[secid, float(row['VALUE'])] for secid, row in last.iterrows()]
+            ),
+        }
+    
+    def respond(self, path, params):
+        """(статус, тело ответа или None, заголовки) для запроса"""
+        self._count('requests')
+        
+        if self._throttled():
+            self._count('throttled')
+            return 429, None, {'Retry-After': str(self.retry_after)}
+        
+        if self.latency:
+            time.sleep(self.latency)
+        
+        if self.error_rate and self.random.random() < self.error_rate:
+            self._count('errors')
+            return 503, None, {}
+        
+        if path == MARKET_PATH:
+            payload = self.market_data()
+        elif path == f"{HISTORY_PREFIX}.json":
+            payload = self.board_history(params)
+        elif path.startswith(f"{HISTORY_PREFIX}/") and path.endswith('.json'):
+            payload = self.security_history(path[len(HISTORY_PREFIX) + 1:-len('.json')], params)
+        else:
+            self._count('not_found')
+            return 404, None, {}
+        
+        self._count('ok')
+        return 200, payload, {}
+    
+    def _handler(self):
+        stub = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                params = {key: values[-1] for key, values in parse_qs(url.query).items()}
+                status, payload, headers = stub.respond(url.path, params)
+                
+                body = json.dumps(payload, ensure_ascii=False).encode('utf-8') if payload else b''
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+            
+            def log_message(self, *args):
+                pass
+        
+        return Handler
+
+
+if __name__ == "__main__":
+    n_securities = int(sys.argv[1]) if len(sys.argv) > 1 else 30
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else synthetic.TRADING_DAYS_PER_YEAR
+    port = int(sys.argv[3]) if len(sys.argv) > 3 else 8700
+    
+    stub = StubISS(n_securities, n_days, port=port).start()
+    print(f"✅ ISS на синтетических данных: {stub.url} ({n_securities} акций x {n_days} дней)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stub.stop()
@@ -0,0 +1,147 @@
+"""
+Синтетическая история торгов в формате ISS
+
+Детерминированный генератор строк с теми же колонками, что возвращает
+MOEXDataCollector.get_history: TRADEDATE строкой 'YYYY-MM-DD', текстовые
+поля, цены и обороты. Пропуски торговых дней, строки без цены и дубликаты
+(повтор страниц ISS) задаются долями.
+
+Запуск: python benchmarks/synthetic.py <путь к датасету> [число акций] [число дней]
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from storage.raw_store import RawDataStore
+
+
+# Колонки истории акций ISS (history/engines/stock/markets/shares)
+HISTORY_COLUMNS = [
+    'BOARDID', 'TRADEDATE', 'SHORTNAME', 'SECID', 'NUMTRADES', 'VALUE',
+    'OPEN', 'LOW', 'HIGH', 'LEGALCLOSEPRICE', 'WAPRICE', 'CLOSE', 'VOLUME',
+    'MARKETPRICE2', 'MARKETPRICE3', 'ADMITTEDQUOTE', 'MP2VALTRD',
+    'MARKETPRICE3TRADESVALUE', 'ADMITTEDVALUE', 'WAVAL', 'TRADINGSESSION',
+    'CURRENCYID', 'TRENDCLSPR', 'TRADE_SESSION_DATE'
+]
+
+# Торговых дней в году - для пересчета лет в дни
+TRADING_DAYS_PER_YEAR = 250
+
+
+def secid(i):
+    return f"S{i:04d}"
+
+
+def make_history(n_securities, n_days, start='2020-01-01', gap_rate=0.0, empty_rate=0.0,
+                 duplicate_rate=0.0, first_security=0, seed=0):
+    """
+    История n_securities акций за n_days торговых дней
+    
+    gap_rate: доля пропущенных дней (строк нет совсем)
+    empty_rate: доля дней без сделок (строка есть, цены пустые, объем 0)
+    duplicate_rate: доля строк, повторенных в конце (как при повторе страницы)
+    first_security: номер первой акции (для генерации по частям)
+    Каждая акция получает свой поток случайных чисел от seed, поэтому
+    история акции не зависит от того, какими частями она сгенерирована.
+    Строки упорядочены по SECID и TRADEDATE (кроме дубликатов).
+    """
+    dates = pd.bdate_range(start, periods=n_days)
+    frames = []
+    
+    for i in range(first_security, first_security + n_securities):
+        rng = np.random.default_rng([seed, i])
+        
+        close = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.02, n_days))), 2)
+        spread = np.abs(rng.normal(0, 0.01, n_days))
+        open_ = np.round(close * (1 + rng.normal(0, 0.005, n_days)), 2)
+        high = np.round(np.maximum(open_, close) * (1 + spread), 2)
+        low = np.round(np.minimum(open_, close) * (1 - spread), 2)
+        volume = rng.integers(1, 10**7, n_days)
+        numtrades = np.maximum(1, volume // 1000)
+        waprice = np.round((open_ + high + low + close) / 4, 2)
+        value = np.round(waprice * volume, 2)
+        
+        df = pd.DataFrame({
+            'BOARDID': 'TQBR',
+            'TRADEDATE': dates.strftime('%Y-%m-%d'),
+            'SHORTNAME': f"Synthetic {i}",
+            'SECID': secid(i),
+            'NUMTRADES': numtrades,
+            'VALUE': value,
+            'OPEN': open_,
+            'LOW': low,
+            'HIGH': high,
+            'LEGALCLOSEPRICE': close,
+            'WAPRICE': waprice,
+            'CLOSE': close,
+            'VOLUME': volume,
+            'MARKETPRICE2': waprice,
+            'MARKETPRICE3': waprice,
+            'ADMITTEDQUOTE': np.nan,
+            'MP2VALTRD': value,
+            'MARKETPRICE3TRADESVALUE': value,
+            'ADMITTEDVALUE': np.nan,
+            'WAVAL': np.nan,
+            'TRADINGSESSION': 3,
+            'CURRENCYID': 'SUR',
+            'TRENDCLSPR': np.round(np.r_[np.nan, np.diff(close) / close[:-1] * 100], 2),
+            'TRADE_SESSION_DATE': dates.strftime('%Y-%m-%d'),
+        })
+        
+        if empty_rate:
+            empty = rng.random(n_days) < empty_rate
+            price_columns = ['OPEN', 'LOW', 'HIGH', 'CLOSE', 'WAPRICE', 'LEGALCLOSEPRICE']
+            df.loc[empty, price_columns] = np.nan
+            df.loc[empty, ['VOLUME', 'NUMTRADES', 'VALUE']] = 0
+        
+        if gap_rate:
+            df = df[rng.random(n_days) >= gap_rate]
+        
+        frames.append(df)
+    
+    df = pd.concat(frames, ignore_index=True)
+    
+    if duplicate_rate:
+        rng = np.random.default_rng([seed, first_security, n_securities])
+        repeated = df[rng.random(len(df)) < duplicate_rate]
+        df = pd.concat([df, repeated], ignore_index=True)
+    
+    return df[HISTORY_COLUMNS]
+
+
+def iter_history(n_securities, n_days, batch_size=100, **kwargs):
+    """Та же история частями по batch_size акций (для больших объемов)"""
+    for first in range(0, n_securities, batch_size):
+        yield make_history(
+            min(batch_size, n_securities - first), n_days, first_security=first, **kwargs
+        )
+
+
+def write_raw_dataset(path, n_securities, n_days, batch_size=100, **kwargs):
+    """
+    Записать историю в хранилище сырых данных как страницы загрузки
+    
+    Дубликаты сохраняются (страницы дописываются без слияния), поэтому
+    датасет выглядит так же, как после потоковой загрузки до finalize.
+    Возвращает число записанных строк.
+    """
+    store = RawDataStore(path)
+    rows = 0
+    for n, df in enumerate(iter_history(n_securities, n_days, batch_size, **kwargs)):
+        store.write_page(df, f"synthetic-{n:05d}")
+        rows += len(df)
+    
+    return rows
+
+
+if __name__ == "__main__":
+    path = sys.argv[1] if len(sys.argv) > 1 else 'data/moex_raw_synthetic'
+    n_securities = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    n_days = int(sys.argv[3]) if len(sys.argv) > 3 else TRADING_DAYS_PER_YEAR
+    
+    rows = write_raw_dataset(path, n_securities, n_days, gap_rate=0.02, duplicate_rate=0.01)
+    print(f"✅ Записано строк: {rows} ({n_securities} акций x {n_days} дней) в {path}")
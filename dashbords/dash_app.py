@@ -1,9 +1,19 @@
 from dash import Dash, dcc, html, Input, Output
 import plotly.graph_objects as go
 import pandas as pd
+import os
+import sys
 
-# Загрузка данных
-df = pd.read_csv('C:/Users/Nik/PycharmProjects/тобд/moex_analytics/data/moex_processed_daily.csv', parse_dates=['TRADEDATE'])
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+
+from dashbords.data_access import default_access
+
+# Доступ к данным: графики читают только срез выбранных акций
+data_access = default_access()
+DASH_COLUMNS = ['SECID', 'TRADEDATE', 'CLOSE', 'DAILY_RETURN', 'VOLATILITY_7']
+# Без данных приложение запускается с пустым списком акций
+securities = data_access.securities() if data_access.exists() else []
 
 # Инициализация приложения
 app = Dash(__name__)
@@ -12,12 +22,15 @@ app = Dash(__name__)
 app.layout = html.Div([
     html.H1("📊 MOEX Analytics Dashboard"),
     
+    html.P("❌ Дневные данные не найдены. Запустите сначала: python flows/main_flow.py")
+    if not securities else html.Div(),
+    
     html.Div([
         html.Label("Выберите акции:"),
         dcc.Dropdown(
             id='securities-dropdown',
-            options=[{'label': sec, 'value': sec} for sec in df['SECID'].unique()],
-            value=list(df['SECID'].unique()[:5]),
+            options=[{'label': sec, 'value': sec} for sec in securities],
+            value=securities[:5],
             multi=True
         )
     ], style={'width': '50%', 'margin': '20px'}),
@@ -38,7 +51,8 @@ app.layout = html.Div([
     [Input('securities-dropdown', 'value')]
 )
 def update_charts(selected_securities):
-    df_filtered = df[df['SECID'].isin(selected_securities)]
+    selected_securities = selected_securities or []
+    df_filtered = data_access.query(selected_securities, columns=DASH_COLUMNS)
     
     # График цен
     fig1 = go.Figure()
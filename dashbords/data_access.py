@@ -0,0 +1,213 @@
+import functools
+import hashlib
+import os
+import sys
+
+import pandas as pd
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import bindparam, create_engine, inspect, text
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+
+from storage.db_loader import LOAD_STATE_TABLE
+from storage.parquet_store import ParquetStore
+
+DAILY_DATASET = os.path.join(PROJECT_DIR, 'data', 'moex_processed_daily')
+DAILY_TABLE = 'moex_daily'
+
+# Сколько последних срезов хранится в памяти процесса дашборда
+QUERY_CACHE_SIZE = 32
+
+
+class ParquetSource:
+    """
+    Parquet-датасет (ParquetStore)
+    
+    Читаются только файлы выбранных бумаг, фильтр по датам отсекает
+    партиции лет и row group'ы, колонки отбираются при чтении.
+    """
+    
+    def __init__(self, path=DAILY_DATASET):
+        self.store = ParquetStore(path)
+    
+    def exists(self):
+        return self.store.exists()
+    
+    def version(self, secids=None):
+        """Версия данных бумаг: отпечаток их файлов (без чтения данных)"""
+        return self.store.fingerprint(secids)
+    
+    def securities(self):
+        return sorted({secid for secid, _ in self.store.partitions()})
+    
+    def _dates(self, year):
+        """Даты из файлов партиций одного года"""
+        return pq.read_table(self.store.files(year=year), columns=['TRADEDATE'])['TRADEDATE']
+    
+    def summary(self):
+        """Число строк (по метаданным Parquet) и период данных (None - данных нет)"""
+        years = sorted({year for _, year in self.store.partitions()})
+        if not years:
+            return {'rows': 0, 'start': None, 'end': None}
+        
+        # Крайние даты - только из файлов первого и последнего года
+        return {
+            'rows': self.store.count_rows(),
+            'start': pd.Timestamp(pc.min(self._dates(years[0])).as_py()),
+            'end': pd.Timestamp(pc.max(self._dates(years[-1])).as_py()),
+        }
+    
+    def read(self, secids, start, end, columns):
+        return self.store.read(columns=columns, secids=secids, start=start, end=end)
+
+
+class DatabaseSource:
+    """
+    Таблица БД, загруженная этапом load (storage/db_loader.py)
+    
+    Условия по бумагам и датам уходят в WHERE: запрос идет по первичному
+    ключу (secid, tradedate), а в Postgres - только по партициям нужных лет.
+    """
+    
+    def __init__(self, url, table=DAILY_TABLE):
+        self.engine = create_engine(url)
+        self.table = table
+    
+    def exists(self):
+        return inspect(self.engine).has_table(self.table)
+    
+    def _execute(self, query, **params):
+        statement = text(query)
+        if 'secids' in params:
+            statement = statement.bindparams(bindparam('secids', expanding=True))
+        with self.engine.connect() as connection:
+            return connection.execute(statement, params).fetchall()
+    
+    def version(self, secids=None):
+        """Версия данных бумаг: отпечатки их файлов на момент загрузки в БД"""
+        query = f"SELECT secid, year, fingerprint FROM {LOAD_STATE_TABLE} WHERE table_name = :table"
+        params = {'table': self.table}
+        if secids is not None:
+            query += " AND secid IN :secids"
+            params['secids'] = list(secids)
+        
+        rows = sorted(tuple(row) for row in self._execute(query, **params))
+        return hashlib.sha256(repr(rows).encode('utf-8')).hexdigest()
+    
+    def securities(self):
+        rows = self._execute(
+            f"SELECT DISTINCT secid FROM {LOAD_STATE_TABLE} WHERE table_name = :table ORDER BY secid",
+            table=self.table
+        )
+        return [row[0] for row in rows]
+    
+    def summary(self):
+        rows, start, end = self._execute(
+            f"SELECT COUNT(*), MIN(tradedate), MAX(tradedate) FROM {self.table}"
+        )[0]
+        # В пустой таблице MIN и MAX - NULL
+        return {
+            'rows': rows,
+            'start': pd.Timestamp(start) if start is not None else None,
+            'end': pd.Timestamp(end) if end is not None else None,
+        }
+    
+    def read(self, secids, start, end, columns):
+        conditions = ['secid IN :secids']
+        params = {'secids': list(secids)}
+        # Даты - строками ISO: так их сравнивают и Postgres, и SQLite
+        if start is not None:
+            conditions.append('tradedate >= :start')
+            params['start'] = start.strftime('%Y-%m-%d')
+        if end is not None:
+            conditions.append('tradedate <= :end')
+            params['end'] = end.strftime('%Y-%m-%d')
+        
+        selected = '*' if columns is None else ', '.join(col.lower() for col in columns)
+        query = text(
+            f"SELECT {selected} FROM {self.table} "
+            f"WHERE {' AND '.join(conditions)} ORDER BY secid, tradedate"
+        ).bindparams(bindparam('secids', expanding=True))
+        
+        with self.engine.connect() as connection:
+            df = pd.read_sql(query, connection, params=params)
+        
+        # Колонки таблицы - имена колонок датасета в нижнем регистре
+        df.columns = [col.upper() for col in df.columns]
+        if 'TRADEDATE' in df.columns:
+            df['TRADEDATE'] = pd.to_datetime(df['TRADEDATE'])
+        return df
+
+
+class DataAccess:
+    """
+    Доступ дашбордов к данным: срезы (бумаги, период, колонки)
+    
+    Фильтры передаются источнику, и читается только нужный срез, а не вся
+    история. Срезы запоминаются в LRU-кэше на cache_size запросов; в ключ
+    входит версия данных выбранных бумаг, поэтому после нового запуска
+    пайплайна срез читается заново. Возвращаемые фреймы общие для всех
+    одинаковых запросов - их нельзя изменять на месте.
+    """
+    
+    def __init__(self, source, cache_size=QUERY_CACHE_SIZE):
+        self.source = source
+        self._query = functools.lru_cache(maxsize=cache_size)(self._read)
+        self._summary = functools.lru_cache(maxsize=1)(self._read_summary)
+    
+    def exists(self):
+        return self.source.exists()
+    
+    def _read(self, secids, start, end, columns, version):
+        return self.source.read(list(secids), start, end, None if columns is None else list(columns))
+    
+    def _read_summary(self, version):
+        summary = self.source.summary()
+        summary['securities'] = self.source.securities()
+        return summary
+    
+    def version(self, secids=None):
+        """Версия данных бумаг secids (None - всех): меняется после нового запуска пайплайна"""
+        return self.source.version(None if secids is None else sorted({str(secid) for secid in secids}))
+    
+    def summary(self):
+        """
+        Бумаги, число строк и период данных (без чтения всей истории)
+        
+        Если данных нет: rows = 0, start и end - None.
+        """
+        return self._summary(self.version())
+    
+    def securities(self):
+        return self.summary()['securities']
+    
+    def query(self, secids, start=None, end=None, columns=None):
+        """
+        Срез данных
+        
+        secids: бумаги; start, end: границы периода (включительно, None - без границы)
+        columns: колонки (None - все; SECID и TRADEDATE добавляются, если их нет)
+        """
+        secids = tuple(sorted({str(secid) for secid in secids}))
+        if columns is not None:
+            columns = tuple(col for col in ['SECID', 'TRADEDATE'] if col not in columns) + tuple(columns)
+        if not secids:
+            return pd.DataFrame(columns=list(columns or []))
+        
+        start = pd.Timestamp(start) if start is not None else None
+        end = pd.Timestamp(end) if end is not None else None
+        return self._query(secids, start, end, columns, self.version(secids))
+    
+    def cache_info(self):
+        return self._query.cache_info()
+
+
+def default_access(database_url=None):
+    """
+    Доступ к дневным данным: БД, если задан адрес (или DATABASE_URL),
+    иначе Parquet-датасет data/moex_processed_daily
+    """
+    url = database_url or os.environ.get('DATABASE_URL')
+    return DataAccess(DatabaseSource(url) if url else ParquetSource())
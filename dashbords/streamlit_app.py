@@ -4,6 +4,19 @@ import plotly.graph_objects as go
 import plotly.express as px
 from plotly.subplots import make_subplots
 import numpy as np
+import os
+import sys
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(PROJECT_DIR)
+
+from dashbords.data_access import default_access
+
+# Колонки, которые используются в дашборде
+DASHBOARD_COLUMNS = [
+    'SECID', 'TRADEDATE', 'OPEN', 'HIGH', 'LOW', 'CLOSE', 'VOLUME',
+    'DAILY_RETURN', 'MA_7', 'MA_30', 'VOLATILITY_7', 'VOLUME_CHANGE'
+]
 
 # Настройка страницы
 st.set_page_config(
@@ -31,16 +44,103 @@ st.markdown("""
 st.title("📊 Аналитика торговых данных Московской биржи")
 st.markdown("---")
 
-# Загрузка данных
-@st.cache_data
-def load_data():
-    df = pd.read_csv('C:/Users/Nik/PycharmProjects/тобд/moex_analytics/data/moex_processed_daily.csv', parse_dates=['TRADEDATE'])
-    return df
+# Доступ к данным: один на процесс, его кэш срезов общий для всех сессий
+@st.cache_resource
+def get_data_access():
+    return default_access()
+
+def security_offsets(df):
+    """
+    Индекс смещений: {SECID: (начало, конец)} строк акции в срезе
+    
+    Срез отсортирован по (SECID, TRADEDATE), поэтому строки акции идут
+    подряд, и выборка акции - срез iloc без прохода по всем строкам.
+    """
+    secids = df['SECID'].to_numpy()
+    if not len(secids):
+        return {}
+    starts = np.flatnonzero(np.r_[True, secids[1:] != secids[:-1]])
+    stops = np.r_[starts[1:], len(secids)]
+    return {secids[start]: (int(start), int(stop)) for start, stop in zip(starts, stops)}
+
+
+def security_rows(selection, secid):
+    """Строки одной акции из среза selection (load_selection)"""
+    start, stop = selection['offsets'].get(secid, (0, 0))
+    return selection['df'].iloc[start:stop]
+
+
+# Вычисления ниже зависят только от выбора акций, периода и версии данных:
+# переключение вида графиков и выбор акции для свечей их не повторяют
+@st.cache_data(max_entries=32, show_spinner=False)
+def load_selection(secids, start_date, end_date, version):
+    """Срез выбранных акций за период и индекс смещений акций в нем"""
+    df = get_data_access().query(secids, start_date, end_date, DASHBOARD_COLUMNS)
+    return {'df': df, 'offsets': security_offsets(df)}
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def selection_analytics(secids, start_date, end_date, version):
+    """Метрики, показатели по акциям, корреляции и статистика среза"""
+    df = load_selection(secids, start_date, end_date, version)['df']
+    by_security = df.groupby('SECID', sort=False)
+    
+    latest_date = df['TRADEDATE'].max()
+    latest_data = df[df['TRADEDATE'] == latest_date]
+    kpi = {
+        'avg_return': df['DAILY_RETURN'].mean(),
+        'avg_volatility': df['VOLATILITY_7'].mean(),
+        'total_volume': latest_data['VOLUME'].sum(),
+        'num_growing': int((latest_data['DAILY_RETURN'] > 0).sum()),
+    }
+    
+    risk_return = by_security.agg({
+        'DAILY_RETURN': 'mean',
+        'VOLATILITY_7': 'mean',
+        'VOLUME': 'mean'
+    }).reset_index()
+    risk_return.columns = ['SECID', 'Return', 'Risk', 'Volume']
+    
+    correlation = None
+    if len(secids) > 1:
+        correlation = df.pivot_table(index='TRADEDATE', columns='SECID', values='DAILY_RETURN').corr()
+    
+    stats = by_security.agg({
+        'CLOSE': ['min', 'max', 'mean', 'last'],
+        'DAILY_RETURN': ['mean', 'std', 'min', 'max'],
+        'VOLUME': 'mean',
+        'VOLATILITY_7': 'mean'
+    }).round(2)
+    stats.columns = [
+        'Мин. цена', 'Макс. цена', 'Средняя цена', 'Текущая цена',
+        'Средняя доходность', 'СКО доходности', 'Мин. доходность', 'Макс. доходность',
+        'Средний объем', 'Волатильность'
+    ]
+    
+    return {
+        'kpi': kpi,
+        'volatility': risk_return.set_index('SECID')['Risk'].sort_values(ascending=False),
+        'returns': risk_return.set_index('SECID')['Return'].sort_values(ascending=False),
+        'risk_return': risk_return,
+        'correlation': correlation,
+        'stats': stats,
+    }
 
-try:
-    df = load_data()
-except:
-    st.error("❌ Файл data/moex_processed_daily.csv не найден. Запустите сначала: python flows/main_flow.py")
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def selection_csv(secids, start_date, end_date, version):
+    return load_selection(secids, start_date, end_date, version)['df'].to_csv(index=False).encode('utf-8')
+
+
+data_access = get_data_access()
+if not data_access.exists():
+    st.error("❌ Дневные данные не найдены. Запустите сначала: python flows/main_flow.py")
+    st.stop()
+
+# Бумаги, число строк и период - без чтения всей истории
+summary = data_access.summary()
+if not summary['rows']:
+    st.error("❌ Дневные данные пусты. Запустите пайплайн: python flows/main_flow.py")
     st.stop()
 
 # Боковая панель с фильтрами
@@ -49,13 +149,13 @@ st.sidebar.header("🎯 Фильтры")
 # Информация о датасете
 st.sidebar.info(f"""
 **Статистика данных:**
-- Акций: {df['SECID'].nunique()}
-- Записей: {len(df):,}
-- Период: {df['TRADEDATE'].min().date()} — {df['TRADEDATE'].max().date()}
+- Акций: {len(summary['securities'])}
+- Записей: {summary['rows']:,}
+- Период: {summary['start'].date()} — {summary['end'].date()}
 """)
 
 # Фильтр: выбор акций
-available_securities = sorted(df['SECID'].unique())
+available_securities = summary['securities']
 selected_securities = st.sidebar.multiselect(
     "Выберите акции:",
     options=available_securities,
@@ -71,16 +171,16 @@ col1, col2 = st.sidebar.columns(2)
 with col1:
     start_date = st.date_input(
         "От:",
-        value=df['TRADEDATE'].max() - pd.Timedelta(days=90),
-        min_value=df['TRADEDATE'].min(),
-        max_value=df['TRADEDATE'].max()
+        value=summary['end'] - pd.Timedelta(days=90),
+        min_value=summary['start'],
+        max_value=summary['end']
     )
 with col2:
     end_date = st.date_input(
         "До:",
-        value=df['TRADEDATE'].max(),
-        min_value=df['TRADEDATE'].min(),
-        max_value=df['TRADEDATE'].max()
+        value=summary['end'],
+        min_value=summary['start'],
+        max_value=summary['end']
     )
 
 # Фильтр: тип сравнения
@@ -89,12 +189,12 @@ comparison_type = st.sidebar.radio(
     ["Абсолютные цены", "Нормализованные (% изменения)"]
 )
 
-# Применение фильтров
-df_filtered = df[
-    (df['SECID'].isin(selected_securities)) &
-    (df['TRADEDATE'] >= pd.to_datetime(start_date)) &
-    (df['TRADEDATE'] <= pd.to_datetime(end_date))
-]
+# Применение фильтров: читается только срез выбранных акций за период
+selection_key = (tuple(sorted(selected_securities)), start_date, end_date,
+                 data_access.version(selected_securities))
+selection = load_selection(*selection_key)
+analytics = selection_analytics(*selection_key)
+df_filtered = selection['df']
 
 if df_filtered.empty:
     st.error("❌ Нет данных для выбранных фильтров")
@@ -106,17 +206,11 @@ if df_filtered.empty:
 st.header("📈 Ключевые показатели")
 col1, col2, col3, col4 = st.columns(4)
 
-# Расчет метрик для выбранных акций
-latest_date = df_filtered['TRADEDATE'].max()
-previous_date = df_filtered[df_filtered['TRADEDATE'] < latest_date]['TRADEDATE'].max()
-
-latest_data = df_filtered[df_filtered['TRADEDATE'] == latest_date]
-previous_data = df_filtered[df_filtered['TRADEDATE'] == previous_date]
-
-avg_return = df_filtered['DAILY_RETURN'].mean()
-avg_volatility = df_filtered['VOLATILITY_7'].mean()
-total_volume = latest_data['VOLUME'].sum()
-num_growing = (latest_data['DAILY_RETURN'] > 0).sum()
+# Метрики выбранных акций (из кэша среза)
+avg_return = analytics['kpi']['avg_return']
+avg_volatility = analytics['kpi']['avg_volatility']
+total_volume = analytics['kpi']['total_volume']
+num_growing = analytics['kpi']['num_growing']
 
 with col1:
     st.metric(
@@ -157,7 +251,7 @@ with tab1:
     fig1 = go.Figure()
     
     for secid in selected_securities:
-        df_sec = df_filtered[df_filtered['SECID'] == secid].sort_values('TRADEDATE')
+        df_sec = security_rows(selection, secid)
         
         if comparison_type == "Нормализованные (% изменения)":
             # Нормализация: первый день = 100%
@@ -201,7 +295,7 @@ with tab2:
         selected_securities
     )
     
-    df_candle = df_filtered[df_filtered['SECID'] == selected_for_candle].tail(90)
+    df_candle = security_rows(selection, selected_for_candle).tail(90)
     
     fig_candle = go.Figure(data=[go.Candlestick(
         x=df_candle['TRADEDATE'],
@@ -248,7 +342,7 @@ col1, col2 = st.columns(2)
 
 with col1:
     # Волатильность
-    volatility = df_filtered.groupby('SECID')['VOLATILITY_7'].mean().sort_values(ascending=False)
+    volatility = analytics['volatility']
     
     fig2 = px.bar(
         x=volatility.index,
@@ -263,7 +357,7 @@ with col1:
 
 with col2:
     # Доходность
-    returns = df_filtered.groupby('SECID')['DAILY_RETURN'].mean().sort_values(ascending=False)
+    returns = analytics['returns']
     
     colors = ['green' if x > 0 else 'red' for x in returns.values]
     
@@ -286,13 +380,7 @@ st.markdown("---")
 # === ГРАФИК 3: Risk-Return диаграмма ===
 st.header("🎯 Risk-Return профиль")
 
-risk_return = df_filtered.groupby('SECID').agg({
-    'DAILY_RETURN': 'mean',
-    'VOLATILITY_7': 'mean',
-    'VOLUME': 'mean'
-}).reset_index()
-
-risk_return.columns = ['SECID', 'Return', 'Risk', 'Volume']
+risk_return = analytics['risk_return']
 
 fig_scatter = px.scatter(
     risk_return,
@@ -323,14 +411,8 @@ st.markdown("---")
 # === ГРАФИК 4: Корреляционная матрица ===
 st.header("🔗 Корреляция доходностей")
 
-if len(selected_securities) > 1:
-    pivot_returns = df_filtered.pivot_table(
-        index='TRADEDATE',
-        columns='SECID',
-        values='DAILY_RETURN'
-    )
-    
-    correlation_matrix = pivot_returns.corr()
+if analytics['correlation'] is not None:
+    correlation_matrix = analytics['correlation']
     
     fig_corr = go.Figure(data=go.Heatmap(
         z=correlation_matrix.values,
@@ -362,7 +444,7 @@ st.header("📊 Распределение доходностей")
 fig_dist = go.Figure()
 
 for secid in selected_securities:
-    df_sec = df_filtered[df_filtered['SECID'] == secid]
+    df_sec = security_rows(selection, secid)
     fig_dist.add_trace(go.Histogram(
         x=df_sec['DAILY_RETURN'],
         name=secid,
@@ -385,18 +467,7 @@ st.markdown("---")
 # === ТАБЛИЦА СО СТАТИСТИКОЙ ===
 st.header("📋 Детальная статистика")
 
-stats = df_filtered.groupby('SECID').agg({
-    'CLOSE': ['min', 'max', 'mean', 'last'],
-    'DAILY_RETURN': ['mean', 'std', 'min', 'max'],
-    'VOLUME': 'mean',
-    'VOLATILITY_7': 'mean'
-}).round(2)
-
-stats.columns = [
-    'Мин. цена', 'Макс. цена', 'Средняя цена', 'Текущая цена',
-    'Средняя доходность', 'СКО доходности', 'Мин. доходность', 'Макс. доходность',
-    'Средний объем', 'Волатильность'
-]
+stats = analytics['stats']
 
 # Раскрашиваем таблицу
 def highlight_values(val):
@@ -419,7 +490,7 @@ st.header("💾 Экспорт данных")
 col1, col2 = st.columns(2)
 
 with col1:
-    csv = df_filtered.to_csv(index=False).encode('utf-8')
+    csv = selection_csv(*selection_key)
     st.download_button(
         label="📥 Скачать отфильтрованные данные (CSV)",
         data=csv,
@@ -443,4 +514,4 @@ with st.expander("🔍 Посмотреть сырые данные"):
 # Футер
 st.markdown("---")
 st.caption("📊 MOEX Analytics Dashboard | Данные: Московская Биржа | Обновлено: " + 
-           df['TRADEDATE'].max().strftime("%Y-%m-%d"))
\ No newline at end of file
+           summary['end'].strftime("%Y-%m-%d"))
\ No newline at end of file
@@ -0,0 +1,706 @@
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+from pandas.api.indexers import BaseIndexer
+
+
+class SegmentWindowIndexer(BaseIndexer):
+    """
+    Скользящее окно, которое не выходит за начало сегмента
+    
+    Сегмент - непрерывный блок строк одной бумаги в отсортированном фрейме.
+    Окно строки i: [max(i - window_size + 1, segment_start[i]), i].
+    На границе сегмента pandas пересчитывает окно с нуля, поэтому результат
+    совпадает с rolling по каждой бумаге отдельно.
+    """
+    
+    def get_window_bounds(self, num_values=0, min_periods=None, center=None, closed=None, step=None):
+        end = np.arange(1, num_values + 1, dtype=np.int64)
+        start = np.maximum(end - self.window_size, self.segment_start).astype(np.int64)
+        return start, end
+
+
+class Segments:
+    """Границы сегментов (бумаг) во фрейме, отсортированном по (SECID, TRADEDATE)"""
+    
+    def __init__(self, keys):
+        keys = _key_values(keys)
+        n = len(keys)
+        
+        self.first = np.ones(n, dtype=bool)
+        if n:
+            self.first[1:] = keys[1:] != keys[:-1]
+        
+        self.ids = np.cumsum(self.first) - 1
+        self.starts = np.flatnonzero(self.first)
+        self.ends = np.append(self.starts[1:], n) - 1
+        self.row_start = self.starts[self.ids] if n else np.empty(0, dtype=np.int64)
+    
+    def __len__(self):
+        return len(self.starts)
+    
+    def ffill(self, values):
+        """Протянуть последнее значение вперед в пределах сегмента"""
+        if not np.isnan(values).any():
+            return values
+        return pd.Series(values).groupby(self.ids).ffill().to_numpy()
+    
+    def shift(self, values):
+        """Значение предыдущей строки той же бумаги (NaN для первой строки)"""
+        shifted = np.empty_like(values)
+        shifted[1:] = values[:-1]
+        shifted[self.first] = np.nan
+        return shifted
+    
+    def pct_change(self, values):
+        """Как Series.pct_change() внутри каждой бумаги"""
+        values = self.ffill(values)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return values / self.shift(values) - 1
+    
+    def rolling(self, values, window, min_periods=1):
+        """Скользящее окно pandas по сегментам (объект Rolling)"""
+        indexer = SegmentWindowIndexer(window_size=window, segment_start=self.row_start)
+        return pd.Series(values).rolling(indexer, min_periods=min_periods)
+    
+    def last(self, values):
+        """Значение последней строки каждой бумаги"""
+        return values[self.ends]
+    
+    def count(self, values):
+        """Число не-NaN значений в каждой бумаге"""
+        return np.add.reduceat(~np.isnan(values), self.starts) if len(self) else np.empty(0, dtype=np.int64)
+    
+    def tails(self, values, n):
+        """Последние n значений каждой бумаги (меньше, если строк меньше)"""
+        return [values[max(start, end + 1 - n):end + 1] for start, end in zip(self.starts, self.ends)]
+    
+    def ewm_mean(self, values, alpha, min_periods=0):
+        """Рекурсивное EMA (adjust=False) внутри каждой бумаги"""
+        ewm = pd.Series(values).groupby(self.ids).ewm(alpha=alpha, adjust=False, min_periods=min_periods)
+        # Сегменты идут подряд по возрастанию ids, поэтому порядок строк совпадает
+        return ewm.mean().to_numpy()
+
+
+def _key_values(keys):
+    """Массив, по которому сравниваются соседние ключи (коды для категорий)"""
+    if isinstance(keys.dtype, pd.CategoricalDtype):
+        return keys.cat.codes.to_numpy()
+    return keys.to_numpy()
+
+
+def sort_by_security(df):
+    """
+    Отсортировать по (SECID, TRADEDATE), если фрейм еще не отсортирован
+    
+    Сортировка устойчивая, поэтому порядок строк совпадает с результатом
+    groupby('SECID').apply(...) по отсортированным внутри группы данным.
+    """
+    keys = _key_values(df['SECID'])
+    dates = df['TRADEDATE'].to_numpy()
+    
+    if len(df) > 1:
+        same = keys[1:] == keys[:-1]
+        if (keys[1:] >= keys[:-1]).all() and (dates[1:][same] > dates[:-1][same]).all():
+            return df
+    
+    return df.sort_values(['SECID', 'TRADEDATE'], kind='stable')
+
+
+# === Онлайн-примитивы (состояние O(1) или O(окна) на бумагу) ===
+
+def _ewm_step(state, key, x, alpha):
+    """
+    Шаг EMA (adjust=False) в той же арифметике, что и pandas ewm
+    
+    Возвращает (значение, число наблюдений).
+    """
+    value, nobs = state.get(key, (math.nan, 0))
+    
+    if not math.isnan(x):
+        nobs += 1
+        if math.isnan(value):
+            value = x
+        elif value != x:
+            old_wt = 1.0 - alpha
+            value = (old_wt * value + alpha * x) / (old_wt + alpha)
+    
+    state[key] = (value, nobs)
+    return value, nobs
+
+
+class _WindowStats:
+    """Скользящие среднее и дисперсия окна (Welford с удалением старых значений)"""
+    
+    def __init__(self, window):
+        self.values = deque(maxlen=window)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+    
+    def push(self, x):
+        if len(self.values) == self.values.maxlen:
+            self._remove(self.values[0])
+        self.values.append(x)
+        
+        if not math.isnan(x):
+            self.n += 1
+            delta = x - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (x - self.mean)
+    
+    def _remove(self, x):
+        if math.isnan(x):
+            return
+        self.n -= 1
+        if self.n == 0:
+            self.mean = self.m2 = 0.0
+            return
+        delta = x - self.mean
+        self.mean -= delta / self.n
+        self.m2 -= delta * (x - self.mean)
+    
+    def avg(self, min_periods=1):
+        return self.mean if self.n >= max(min_periods, 1) else math.nan
+    
+    def std(self, min_periods=1, ddof=1):
+        if self.n < max(min_periods, 1) or self.n <= ddof:
+            return math.nan
+        return math.sqrt(max(self.m2, 0.0) / (self.n - ddof))
+
+
+def _pct(x, prev):
+    if math.isnan(prev):
+        return math.nan
+    if prev == 0:
+        return math.nan if x == 0 or math.isnan(x) else math.copysign(math.inf, x)
+    return x / prev - 1
+
+
+def _window_states(ctx, col, window):
+    """Окна _WindowStats по последним window значениям col каждой бумаги"""
+    states = []
+    for tail in ctx.segments.tails(ctx[col], window):
+        stats = _WindowStats(window)
+        for x in tail:
+            stats.push(float(x))
+        states.append({'window': stats})
+    return states
+
+
+def _ewm_states(segments, values, alpha):
+    """(значение, число наблюдений) EMA каждой бумаги после всех ее строк"""
+    last = segments.last(segments.ewm_mean(values, alpha))
+    return list(zip(last.tolist(), segments.count(values).tolist()))
+
+
+# === Реестр индикаторов ===
+
+class Indicator:
+    """
+    Описание индикатора
+    
+    inputs - колонки фрейма или выходы других индикаторов, outputs - новые
+    колонки, lookback - сколько предыдущих строк бумаги влияет на значение
+    (None - бесконечная память, как у EMA). compute() считает индикатор
+    векторно по всем бумагам сразу, update() - онлайн по одной новой строке
+    с состоянием init_state() на каждую бумагу, seed() - состояние после
+    всей истории по векторному расчету, без прогона строк через update().
+    """
+    
+    name = None
+    inputs = ()
+    outputs = ()
+    lookback = 0
+    
+    def compute(self, ctx):
+        """{колонка: массив} для всех строк контекста"""
+        raise NotImplementedError
+    
+    def init_state(self):
+        return {}
+    
+    def update(self, state, bar):
+        """{колонка: значение} для новой строки bar (словарь входов)"""
+        raise NotImplementedError
+    
+    def seed(self, ctx):
+        """
+        Состояния после всех строк каждой бумаги контекста (список по бумагам)
+        
+        По умолчанию строки прогоняются через update(); индикаторы реестра
+        переопределяют метод и строят состояние векторно.
+        """
+        states = []
+        for start, end in zip(ctx.segments.starts, ctx.segments.ends):
+            state = self.init_state()
+            for i in range(start, end + 1):
+                self.update(state, {col: ctx[col][i] for col in self.inputs})
+            states.append(state)
+        return states
+
+
+class DailyReturn(Indicator):
+    name = 'DAILY_RETURN'
+    inputs = ('CLOSE',)
+    outputs = ('DAILY_RETURN',)
+    lookback = 1
+    
+    def compute(self, ctx):
+        return {'DAILY_RETURN': ctx.segments.pct_change(ctx['CLOSE']) * 100}
+    
+    def update(self, state, bar):
+        prev = state.get('prev', math.nan)
+        close = bar['CLOSE'] if not math.isnan(bar['CLOSE']) else prev
+        state['prev'] = close
+        return {'DAILY_RETURN': _pct(close, prev) * 100}
+    
+    def seed(self, ctx):
+        # Последнее известное закрытие бумаги
+        prev = ctx.segments.last(ctx.segments.ffill(ctx['CLOSE']))
+        return [{'prev': value} for value in prev.tolist()]
+
+
+class VolumeChange(Indicator):
+    name = 'VOLUME_CHANGE'
+    inputs = ('VOLUME',)
+    outputs = ('VOLUME_CHANGE',)
+    lookback = 1
+    
+    def compute(self, ctx):
+        return {'VOLUME_CHANGE': ctx.segments.pct_change(ctx['VOLUME']) * 100}
+    
+    def update(self, state, bar):
+        prev = state.get('prev', math.nan)
+        volume = bar['VOLUME'] if not math.isnan(bar['VOLUME']) else prev
+        state['prev'] = volume
+        return {'VOLUME_CHANGE': _pct(volume, prev) * 100}
+    
+    def seed(self, ctx):
+        prev = ctx.segments.last(ctx.segments.ffill(ctx['VOLUME']))
+        return [{'prev': value} for value in prev.tolist()]
+
+
+class MovingAverage(Indicator):
+    inputs = ('CLOSE',)
+    
+    def __init__(self, window):
+        self.window = window
+        self.name = f"MA_{window}"
+        self.outputs = (self.name,)
+        self.lookback = window - 1
+    
+    def compute(self, ctx):
+        return {self.name: ctx.segments.rolling(ctx['CLOSE'], self.window).mean().to_numpy()}
+    
+    def init_state(self):
+        return {'window': _WindowStats(self.window)}
+    
+    def update(self, state, bar):
+        state['window'].push(bar['CLOSE'])
+        return {self.name: state['window'].avg()}
+    
+    def seed(self, ctx):
+        return _window_states(ctx, 'CLOSE', self.window)
+
+
+class Volatility(Indicator):
+    """Скользящее СКО дневной доходности, %"""
+    
+    inputs = ('DAILY_RETURN',)
+    
+    def __init__(self, window):
+        self.window = window
+        self.name = f"VOLATILITY_{window}"
+        self.outputs = (self.name,)
+        self.lookback = window
+    
+    def compute(self, ctx):
+        return {self.name: ctx.segments.rolling(ctx['DAILY_RETURN'], self.window).std().to_numpy()}
+    
+    def init_state(self):
+        return {'window': _WindowStats(self.window)}
+    
+    def update(self, state, bar):
+        state['window'].push(bar['DAILY_RETURN'])
+        return {self.name: state['window'].std()}
+    
+    def seed(self, ctx):
+        return _window_states(ctx, 'DAILY_RETURN', self.window)
+
+
+class EMA(Indicator):
+    inputs = ('CLOSE',)
+    lookback = None
+    
+    def __init__(self, span):
+        self.span = span
+        self.alpha = 2.0 / (span + 1)
+        self.name = f"EMA_{span}"
+        self.outputs = (self.name,)
+    
+    def compute(self, ctx):
+        return {self.name: ctx.segments.ewm_mean(ctx['CLOSE'], self.alpha)}
+    
+    def update(self, state, bar):
+        value, _ = _ewm_step(state, 'ema', bar['CLOSE'], self.alpha)
+        return {self.name: value}
+    
+    def seed(self, ctx):
+        return [{'ema': ema} for ema in _ewm_states(ctx.segments, ctx['CLOSE'], self.alpha)]
+
+
+def _rsi(avg_gain, avg_loss):
+    if avg_loss == 0:
+        return 100.0 if avg_gain > 0 else math.nan
+    return 100 - 100 / (1 + avg_gain / avg_loss)
+
+
+class RSI(Indicator):
+    """Индекс относительной силы Уайлдера (сглаживание alpha = 1/period)"""
+    
+    inputs = ('CLOSE',)
+    lookback = None
+    
+    def __init__(self, period=14):
+        self.period = period
+        self.alpha = 1.0 / period
+        self.name = f"RSI_{period}"
+        self.outputs = (self.name,)
+    
+    def compute(self, ctx):
+        close = ctx.segments.ffill(ctx['CLOSE'])
+        delta = close - ctx.segments.shift(close)
+        
+        avg_gain = ctx.segments.ewm_mean(np.clip(delta, 0, None), self.alpha, self.period)
+        avg_loss = ctx.segments.ewm_mean(np.clip(-delta, 0, None), self.alpha, self.period)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rsi = 100 - 100 / (1 + avg_gain / avg_loss)
+        return {self.name: rsi}
+    
+    def update(self, state, bar):
+        prev = state.get('prev', math.nan)
+        close = bar['CLOSE'] if not math.isnan(bar['CLOSE']) else prev
+        state['prev'] = close
+        
+        delta = close - prev
+        gain, nobs = _ewm_step(state, 'gain', max(delta, 0.0) if not math.isnan(delta) else math.nan, self.alpha)
+        loss, _ = _ewm_step(state, 'loss', max(-delta, 0.0) if not math.isnan(delta) else math.nan, self.alpha)
+        
+        if nobs < self.period:
+            return {self.name: math.nan}
+        return {self.name: _rsi(gain, loss)}
+    
+    def seed(self, ctx):
+        close = ctx.segments.ffill(ctx['CLOSE'])
+        delta = close - ctx.segments.shift(close)
+        gains = _ewm_states(ctx.segments, np.clip(delta, 0, None), self.alpha)
+        losses = _ewm_states(ctx.segments, np.clip(-delta, 0, None), self.alpha)
+        prev = ctx.segments.last(close).tolist()
+        return [
+            {'prev': value, 'gain': gain, 'loss': loss}
+            for value, gain, loss in zip(prev, gains, losses)
+        ]
+
+
+class MACD(Indicator):
+    inputs = ('CLOSE',)
+    lookback = None
+    
+    def __init__(self, fast=12, slow=26, signal=9):
+        self.alphas = [2.0 / (span + 1) for span in (fast, slow, signal)]
+        self.name = 'MACD'
+        self.outputs = ('MACD', 'MACD_SIGNAL', 'MACD_HIST')
+    
+    def compute(self, ctx):
+        fast, slow, signal = self.alphas
+        macd = ctx.segments.ewm_mean(ctx['CLOSE'], fast) - ctx.segments.ewm_mean(ctx['CLOSE'], slow)
+        macd_signal = ctx.segments.ewm_mean(macd, signal)
+        return {'MACD': macd, 'MACD_SIGNAL': macd_signal, 'MACD_HIST': macd - macd_signal}
+    
+    def update(self, state, bar):
+        fast, slow, signal = self.alphas
+        macd = _ewm_step(state, 'fast', bar['CLOSE'], fast)[0] - _ewm_step(state, 'slow', bar['CLOSE'], slow)[0]
+        macd_signal, _ = _ewm_step(state, 'signal', macd, signal)
+        return {'MACD': macd, 'MACD_SIGNAL': macd_signal, 'MACD_HIST': macd - macd_signal}
+    
+    def seed(self, ctx):
+        fast, slow, signal = self.alphas
+        segments = ctx.segments
+        macd = segments.ewm_mean(ctx['CLOSE'], fast) - segments.ewm_mean(ctx['CLOSE'], slow)
+        return [
+            {'fast': f, 'slow': s, 'signal': g}
+            for f, s, g in zip(
+                _ewm_states(segments, ctx['CLOSE'], fast),
+                _ewm_states(segments, ctx['CLOSE'], slow),
+                _ewm_states(segments, macd, signal)
+            )
+        ]
+
+
+class Bollinger(Indicator):
+    """Полосы Боллинджера: MA ± k стандартных отклонений (генеральное СКО)"""
+    
+    inputs = ('CLOSE',)
+    outputs = ('BB_MID', 'BB_UPPER', 'BB_LOWER')
+    
+    def __init__(self, window=20, k=2.0):
+        self.window = window
+        self.k = k
+        self.name = 'BOLLINGER'
+        self.lookback = window - 1
+    
+    def compute(self, ctx):
+        rolling = ctx.segments.rolling(ctx['CLOSE'], self.window, min_periods=self.window)
+        mid = rolling.mean().to_numpy()
+        std = rolling.std(ddof=0).to_numpy()
+        return {'BB_MID': mid, 'BB_UPPER': mid + self.k * std, 'BB_LOWER': mid - self.k * std}
+    
+    def init_state(self):
+        return {'window': _WindowStats(self.window)}
+    
+    def update(self, state, bar):
+        window = state['window']
+        window.push(bar['CLOSE'])
+        mid = window.avg(self.window)
+        std = window.std(self.window, ddof=0)
+        return {'BB_MID': mid, 'BB_UPPER': mid + self.k * std, 'BB_LOWER': mid - self.k * std}
+    
+    def seed(self, ctx):
+        return _window_states(ctx, 'CLOSE', self.window)
+
+
+class ATR(Indicator):
+    """Средний истинный диапазон (сглаживание Уайлдера)"""
+    
+    inputs = ('HIGH', 'LOW', 'CLOSE')
+    lookback = None
+    
+    def __init__(self, period=14):
+        self.period = period
+        self.alpha = 1.0 / period
+        self.name = f"ATR_{period}"
+        self.outputs = (self.name,)
+    
+    def compute(self, ctx):
+        high, low = ctx['HIGH'], ctx['LOW']
+        prev_close = ctx.segments.shift(ctx['CLOSE'])
+        # Для первой строки бумаги предыдущего закрытия нет: fmax игнорирует NaN
+        true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+        return {self.name: ctx.segments.ewm_mean(true_range, self.alpha, self.period)}
+    
+    def update(self, state, bar):
+        high, low = bar['HIGH'], bar['LOW']
+        prev_close = state.get('prev', math.nan)
+        state['prev'] = bar['CLOSE']
+        
+        ranges = [r for r in (high - low, abs(high - prev_close), abs(low - prev_close)) if not math.isnan(r)]
+        true_range = max(ranges) if ranges else math.nan
+        
+        value, nobs = _ewm_step(state, 'atr', true_range, self.alpha)
+        return {self.name: value if nobs >= self.period else math.nan}
+    
+    def seed(self, ctx):
+        high, low = ctx['HIGH'], ctx['LOW']
+        prev_close = ctx.segments.shift(ctx['CLOSE'])
+        true_range = np.fmax(high - low, np.fmax(np.abs(high - prev_close), np.abs(low - prev_close)))
+        # update() хранит последнее закрытие как есть, без протягивания пропусков
+        prev = ctx.segments.last(ctx['CLOSE']).tolist()
+        atr = _ewm_states(ctx.segments, true_range, self.alpha)
+        return [{'prev': value, 'atr': state} for value, state in zip(prev, atr)]
+
+
+class VolumeZScore(Indicator):
+    """Отклонение объема от скользящего среднего в единицах СКО"""
+    
+    inputs = ('VOLUME',)
+    
+    def __init__(self, window=20):
+        self.window = window
+        self.name = f"VOLUME_ZSCORE_{window}"
+        self.outputs = (self.name,)
+        self.lookback = window - 1
+    
+    def compute(self, ctx):
+        rolling = ctx.segments.rolling(ctx['VOLUME'], self.window, min_periods=self.window)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            zscore = (ctx['VOLUME'] - rolling.mean().to_numpy()) / rolling.std().to_numpy()
+        return {self.name: zscore}
+    
+    def init_state(self):
+        return {'window': _WindowStats(self.window)}
+    
+    def update(self, state, bar):
+        window = state['window']
+        window.push(bar['VOLUME'])
+        std = window.std(self.window)
+        if math.isnan(std) or std == 0:
+            return {self.name: math.nan}
+        return {self.name: (bar['VOLUME'] - window.avg(self.window)) / std}
+    
+    def seed(self, ctx):
+        return _window_states(ctx, 'VOLUME', self.window)
+
+
+INDICATORS = {}
+
+
+def register(indicator):
+    """Добавить индикатор в реестр (по имени)"""
+    INDICATORS[indicator.name] = indicator
+    return indicator
+
+
+for _indicator in [
+    DailyReturn(), MovingAverage(7), MovingAverage(30), Volatility(7), VolumeChange(),
+    EMA(12), EMA(26), RSI(14), MACD(12, 26, 9), Bollinger(20, 2.0), ATR(14), VolumeZScore(20),
+]:
+    register(_indicator)
+
+
+# Набор по умолчанию - прежние колонки пайплайна
+DEFAULT_INDICATORS = ['DAILY_RETURN', 'MA_7', 'MA_30', 'VOLATILITY_7', 'VOLUME_CHANGE']
+INDICATOR_COLUMNS = DEFAULT_INDICATORS
+
+
+def resolve(names=None):
+    """
+    Индикаторы в порядке расчета
+    
+    Зависимости (входы, которые являются выходами других индикаторов)
+    добавляются перед зависимым индикатором.
+    """
+    names = DEFAULT_INDICATORS if names is None else names
+    producers = {col: ind for ind in INDICATORS.values() for col in ind.outputs}
+    
+    ordered = []
+    
+    def visit(name):
+        if name not in INDICATORS:
+            raise KeyError(f"Неизвестный индикатор: {name}. Доступны: {', '.join(INDICATORS)}")
+        indicator = INDICATORS[name]
+        if indicator in ordered:
+            return
+        for col in indicator.inputs:
+            if col in producers:
+                visit(producers[col].name)
+        ordered.append(indicator)
+    
+    for name in names:
+        visit(name)
+    
+    return ordered
+
+
+def output_columns(names=None):
+    return [col for ind in resolve(names) for col in ind.outputs]
+
+
+def input_columns(names=None):
+    """Колонки исходных данных, нужные для расчета индикаторов"""
+    indicators = resolve(names)
+    produced = {col for ind in indicators for col in ind.outputs}
+    return sorted({col for ind in indicators for col in ind.inputs} - produced)
+
+
+class IndicatorContext:
+    """Данные одного прохода: сегменты бумаг и колонки как float64-массивы"""
+    
+    def __init__(self, df):
+        self.df = df
+        self.segments = Segments(df['SECID'])
+        self.columns = {}
+    
+    def __getitem__(self, col):
+        if col not in self.columns:
+            self.columns[col] = self.df[col].to_numpy(dtype='float64')
+        return self.columns[col]
+
+
+def compute_indicators(df, names=None):
+    """
+    Расчет индикаторов для всех бумаг за один проход
+    
+    Одна глобальная сортировка по (SECID, TRADEDATE), общие границы
+    сегментов для всех индикаторов и векторные операции без Python-callback'ов
+    на каждую бумагу. Считаются только индикаторы names (и их зависимости),
+    по умолчанию - DEFAULT_INDICATORS. Их результат численно совпадает
+    с прежним groupby('SECID').apply(...).
+    """
+    indicators = resolve(names)
+    df = sort_by_security(df)
+    
+    if df.empty:
+        return df.assign(**{col: pd.Series(dtype='float64') for col in output_columns(names)})
+    
+    ctx = IndicatorContext(df)
+    for indicator in indicators:
+        ctx.columns.update(indicator.compute(ctx))
+    
+    df = df.copy()
+    for indicator in indicators:
+        for col in indicator.outputs:
+            df[col] = ctx.columns[col]
+    
+    return df
+
+
+class StreamingIndicators:
+    """
+    Онлайн-расчет индикаторов по мере поступления новых строк
+    
+    Для каждой бумаги хранится только состояние индикаторов
+    (рекурсивные EMA и окна фиксированного размера), поэтому обработка
+    новой строки не зависит от длины истории.
+    """
+    
+    def __init__(self, names=None):
+        self.indicators = resolve(names)
+        self.states = {}
+    
+    def update(self, secid, bar):
+        """Значения индикаторов для новой строки бумаги secid"""
+        states = self.states.get(secid)
+        if states is None:
+            states = self.states[secid] = [ind.init_state() for ind in self.indicators]
+        
+        values = {col: float(value) for col, value in bar.items()}
+        for indicator, state in zip(self.indicators, states):
+            values.update(indicator.update(state, values))
+        
+        return {col: values[col] for ind in self.indicators for col in ind.outputs}
+    
+    def update_frame(self, df):
+        """Прогнать строки фрейма (отсортированного по бумаге и дате) через update"""
+        inputs = input_columns([ind.name for ind in self.indicators])
+        rows = [
+            self.update(secid, dict(zip(inputs, values)))
+            for secid, values in zip(df['SECID'], df[inputs].itertuples(index=False, name=None))
+        ]
+        columns = [col for ind in self.indicators for col in ind.outputs]
+        return pd.DataFrame(rows, index=df.index, columns=columns, dtype='float64')
+    
+    def seed_frame(self, df):
+        """
+        Состояния бумаг после всех строк фрейма без прогона строк через update
+        
+        Окна строятся по последним lookback строкам каждой бумаги, рекурсивные
+        EMA - по последним значениям векторного расчета и числу наблюдений.
+        Колонки индикаторов фрейма используются как есть (входы зависимых
+        индикаторов), если их нет - индикаторы считаются векторно.
+        """
+        names = [ind.name for ind in self.indicators]
+        if any(col not in df.columns for col in output_columns(names)):
+            df = compute_indicators(df, names)
+        df = sort_by_security(df)
+        if df.empty:
+            return
+        
+        ctx = IndicatorContext(df)
+        seeded = [indicator.seed(ctx) for indicator in self.indicators]
+        secids = df['SECID'].to_numpy()[ctx.segments.starts]
+        for i, secid in enumerate(secids):
+            self.states[secid] = [states[i] for states in seeded]
@@ -0,0 +1,269 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+import psutil
+from dask.utils import key_split
+
+
+class PeakRSS:
+    """Пиковая память процесса (RSS, МБ) за время блока with - опросом в фоне"""
+    
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.process = psutil.Process()
+        self.peak = 0
+        self._stop = threading.Event()
+    
+    def _poll(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self.process.memory_info().rss)
+            self._stop.wait(self.interval)
+    
+    def __enter__(self):
+        self.peak = self.process.memory_info().rss
+        self._thread = threading.Thread(target=self._poll, daemon=True)
+        self._thread.start()
+        return self
+    
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+    
+    @property
+    def peak_mb(self):
+        return self.peak / 1024**2
+
+
+def _cpu_seconds(process):
+    """Процессорное время процесса и завершенных дочерних процессов"""
+    times = process.cpu_times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _io_bytes(process):
+    """Прочитано и записано байт процессом (None, если ОС не отдает счетчики)"""
+    try:
+        counters = process.io_counters()
+    except (AttributeError, psutil.Error):
+        return None, None
+    # read_chars/write_chars учитывают и чтение из кэша страниц (Linux)
+    return (getattr(counters, 'read_chars', counters.read_bytes),
+            getattr(counters, 'write_chars', counters.write_bytes))
+
+
+def summarize_task_stream(tasks):
+    """
+    Сводка task stream Dask: число задач, время вычислений, передачи
+    и обмена с диском, самые долгие группы задач (по префиксу ключа)
+    """
+    seconds = {'compute': 0.0, 'transfer': 0.0, 'disk': 0.0}
+    prefixes = {}
+    
+    for task in tasks:
+        for startstop in task.get('startstops', ()):
+            duration = startstop['stop'] - startstop['start']
+            action = startstop['action']
+            if action == 'compute':
+                seconds['compute'] += duration
+                prefix = key_split(task['key'])
+                prefixes[prefix] = prefixes.get(prefix, 0.0) + duration
+            elif action == 'transfer':
+                seconds['transfer'] += duration
+            elif action.startswith('disk'):
+                seconds['disk'] += duration
+    
+    top = sorted(prefixes.items(), key=lambda item: item[1], reverse=True)[:5]
+    return {
+        'tasks': len(tasks),
+        'compute_seconds': round(seconds['compute'], 4),
+        'transfer_seconds': round(seconds['transfer'], 4),
+        'disk_seconds': round(seconds['disk'], 4),
+        'top_prefixes': {prefix: round(value, 4) for prefix, value in top},
+    }
+
+
+def summarize_workers(client):
+    """Память воркеров Dask: суммарно, максимум на воркер, лимит, сброс на диск"""
+    workers = client.scheduler_info()['workers'].values()
+    memory = [w.get('metrics', {}).get('memory', 0) for w in workers]
+    spilled = [w.get('metrics', {}).get('spilled_bytes', {}).get('disk', 0) for w in workers]
+    limits = [w.get('memory_limit') or 0 for w in workers]
+    
+    return {
+        'workers': len(memory),
+        'memory_mb': round(sum(memory) / 1024**2, 1),
+        'max_worker_memory_mb': round(max(memory, default=0) / 1024**2, 1),
+        'memory_limit_mb': round(sum(limits) / 1024**2, 1),
+        'spilled_mb': round(sum(spilled) / 1024**2, 1),
+    }
+
+
+class PipelineMetrics:
+    """
+    Метрики этапов пайплайна
+    
+    Для каждого этапа (блок stage) записываются время, процессорное время,
+    строки на входе и выходе, прочитанные и записанные байты и пиковая
+    память процесса. Если подключен Dask-клиент (attach), добавляются
+    сводка task stream и память воркеров. Результат - JSON или текстовый
+    формат Prometheus (write) и артефакт Prefect (publish_artifact).
+    """
+    
+    # Числовые поля этапа, которые экспортируются в Prometheus
+    PROMETHEUS_FIELDS = [
+        'wall_seconds', 'cpu_seconds', 'rows_in', 'rows_out', 'rows_per_second',
+        'bytes_read', 'bytes_written', 'peak_rss_mb'
+    ]
+    
+    def __init__(self, client=None):
+        self.client = client
+        self.stages = []
+        self.created = time.strftime('%Y-%m-%dT%H:%M:%S')
+        self._lock = threading.Lock()
+    
+    def attach(self, client):
+        """Собирать метрики Dask с этого клиента"""
+        self.client = client
+    
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """
+        Замер этапа: блок with получает запись этапа
+        
+        В запись можно дописать rows_out (и поправить rows_in) внутри блока.
+        """
+        from distributed import get_task_stream
+        
+        process = psutil.Process()
+        record = {'stage': name, 'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                  'rows_in': rows_in, 'rows_out': None}
+        read_before, written_before = _io_bytes(process)
+        cpu_before = _cpu_seconds(process)
+        # Клиент, подключенный уже внутри этапа, учитывается со следующего этапа
+        client = self.client
+        stream = get_task_stream(client) if client is not None else nullcontext()
+        
+        start = time.perf_counter()
+        try:
+            with PeakRSS() as rss, stream as task_stream:
+                yield record
+        finally:
+            record['wall_seconds'] = round(time.perf_counter() - start, 4)
+            record['cpu_seconds'] = round(_cpu_seconds(process) - cpu_before, 4)
+            
+            read_after, written_after = _io_bytes(process)
+            record['bytes_read'] = read_after - read_before if read_before is not None else None
+            record['bytes_written'] = (
+                written_after - written_before if written_before is not None else None
+            )
+            record['peak_rss_mb'] = round(rss.peak_mb, 1)
+            
+            rows = record['rows_out'] if record['rows_out'] is not None else record['rows_in']
+            record['rows_per_second'] = (
+                round(rows / record['wall_seconds'], 1) if rows and record['wall_seconds'] else None
+            )
+            
+            if client is not None:
+                record['dask'] = summarize_task_stream(task_stream.data)
+                record['dask']['memory'] = summarize_workers(client)
+            
+            with self._lock:
+                self.stages.append(record)
+    
+    def summary(self):
+        return {'created': self.created, 'stages': list(self.stages)}
+    
+    def to_prometheus(self):
+        """
+        Метрики в текстовом формате Prometheus: moex_stage_<поле>{stage, seq}
+        
+        seq - порядковый номер записи: один метод может вызываться несколько раз.
+        """
+        labels = [f'stage="{record["stage"]}",seq="{seq}"' for seq, record in enumerate(self.stages)]
+        
+        lines = []
+        for field in self.PROMETHEUS_FIELDS:
+            metric = f"moex_stage_{field}"
+            lines.append(f"# TYPE {metric} gauge")
+            for label, record in zip(labels, self.stages):
+                value = record.get(field)
+                if value is not None:
+                    lines.append(f"{metric}{{{label}}} {value}")
+        
+        for label, record in zip(labels, self.stages):
+            dask_info = record.get('dask')
+            if dask_info:
+                values = {field: dask_info[field] for field in
+                          ('tasks', 'compute_seconds', 'transfer_seconds', 'disk_seconds')}
+                values.update(dask_info['memory'])
+                for field, value in values.items():
+                    lines.append(f"moex_stage_dask_{field}{{{label}}} {value}")
+        
+        return '\n'.join(lines) + '\n'
+    
+    def to_markdown(self):
+        """Таблица этапов для артефакта Prefect"""
+        header = ['Этап', 'Время, с', 'CPU, с', 'Строк на входе', 'Строк на выходе',
+                  'Строк/с', 'Прочитано, МБ', 'Записано, МБ', 'Пик RSS, МБ']
+        lines = ['| ' + ' | '.join(header) + ' |', '|' + '---|' * len(header)]
+        
+        mb = lambda value: f"{value / 1024**2:.1f}" if value is not None else ''
+        show = lambda value: '' if value is None else str(value)
+        for r in self.stages:
+            lines.append('| ' + ' | '.join([
+                r['stage'], show(r['wall_seconds']), show(r['cpu_seconds']), show(r['rows_in']),
+                show(r['rows_out']), show(r['rows_per_second']), mb(r['bytes_read']),
+                mb(r['bytes_written']), show(r['peak_rss_mb'])
+            ]) + ' |')
+        
+        return '\n'.join(lines)
+    
+    def write(self, path):
+        """Записать метрики: *.prom - формат Prometheus, иначе JSON"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            if path.endswith('.prom'):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.summary(), f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+    
+    def publish_artifact(self, key='moex-pipeline-metrics'):
+        """Опубликовать таблицу этапов артефактом Prefect (внутри flow)"""
+        from prefect.artifacts import create_markdown_artifact
+        
+        return create_markdown_artifact(
+            markdown=self.to_markdown(),
+            key=key,
+            description='Метрики этапов пайплайна'
+        )
+
+
+def instrumented(method):
+    """
+    Записывать вызовы метода этапом в self.metrics (если он задан)
+    
+    Строки на входе и выходе берутся из self.row_count().
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if self.metrics is None:
+            return method(self, *args, **kwargs)
+        
+        name = f"{type(self).__name__}.{method.__name__}"
+        with self.metrics.stage(name, rows_in=self.row_count()) as record:
+            result = method(self, *args, **kwargs)
+            record['rows_out'] = self.row_count()
+        return result
+    
+    return wrapper
@@ -0,0 +1,101 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import psutil
+from dask.distributed import LocalCluster
+
+
+# Режимы обработки:
+# pandas - один процесс
+# processes - Pandas в пуле процессов, бумаги поделены между процессами
+# local - LocalCluster в этом же запуске (данные могут не помещаться в память)
+# dask - локальный планировщик Dask без кластера (обработка вне памяти)
+MODES = ['auto', 'pandas', 'processes', 'local', 'dask']
+
+# Меньше этого объема параллельная обработка не окупает запуск процессов
+MIN_PARALLEL_MB = 256
+# Доля доступной памяти, которую получают воркеры LocalCluster
+CLUSTER_MEMORY_SHARE = 0.8
+
+
+def machine_resources():
+    """Доступные процессу ядра и свободная память машины: (ядра, МБ)"""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    
+    memory_mb = psutil.virtual_memory().available / 1024**2
+    return cores, memory_mb
+
+
+def choose_mode(estimate_mb, cores, memory_mb):
+    """
+    Режим обработки по оценке памяти на обработку
+    
+    estimate_mb: оценка памяти на обработку в Pandas (с индикаторами)
+    Мало данных или одно ядро - pandas; данные помещаются в память -
+    processes (без планировщика и перераспределения); иначе - local,
+    где воркеры сбрасывают лишнее на диск.
+    """
+    if cores <= 1 or estimate_mb < MIN_PARALLEL_MB:
+        return 'pandas'
+    # Родитель держит весь фрейм, процессы - свои части: вдвое больше оценки
+    if estimate_mb * 2 < memory_mb:
+        return 'processes'
+    return 'local'
+
+
+def start_local_cluster(cores, memory_mb):
+    """
+    LocalCluster по размеру машины
+    
+    Один поток на воркер (расчеты в numpy/pandas держат GIL), память
+    делится между воркерами поровну - при превышении воркеры сбрасывают
+    данные на диск.
+    """
+    memory_limit = int(memory_mb * CLUSTER_MEMORY_SHARE / cores * 1024**2)
+    return LocalCluster(
+        n_workers=cores,
+        threads_per_worker=1,
+        memory_limit=memory_limit,
+        dashboard_address=None
+    )
+
+
+def start_pool(cores):
+    return ProcessPoolExecutor(max_workers=cores)
+
+
+def shard_by_security(df, shards):
+    """
+    Разбить фрейм на части по бумагам с примерно равным числом строк
+    
+    Все строки одной бумаги попадают в одну часть; бумаги раскладываются
+    от крупных к мелким в наименее заполненную часть.
+    """
+    sizes = df['SECID'].value_counts(sort=True)
+    sizes = sizes[sizes > 0]
+    shards = max(1, min(shards, len(sizes)))
+    
+    loads = np.zeros(shards, dtype=np.int64)
+    owner = {}
+    for secid, size in sizes.items():
+        shard = int(np.argmin(loads))
+        owner[secid] = shard
+        loads[shard] += size
+    
+    codes = np.asarray(df['SECID'].map(owner), dtype=np.int64)
+    return [df[codes == shard] for shard in range(shards)]
+
+
+def map_shards(pool, func, df, shards, *args):
+    """
+    Применить func(часть, *args) к частям фрейма по бумагам в пуле процессов
+    
+    Возвращает список результатов в порядке частей.
+    """
+    futures = [pool.submit(func, part, *args) for part in shard_by_security(df, shards)]
+    return [future.result() for future in futures]
+
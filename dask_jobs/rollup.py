@@ -0,0 +1,198 @@
+import numpy as np
+import pandas as pd
+
+from dask_jobs.indicators import _key_values, sort_by_security
+
+
+# Разрешения агрегации:
+# W - календарная неделя (метка - воскресенье, как resample('W'))
+# M, Q - месяц и квартал (метка - последний день периода)
+# TW - торговая неделя (метка - последний торговый день недели по календарю)
+RESOLUTIONS = ['W', 'M', 'Q', 'TW']
+
+# Агрегаты OHLCV и индикаторов; колонки, которых нет во фрейме, пропускаются
+AGGREGATIONS = {
+    'OPEN': 'first',
+    'HIGH': 'max',
+    'LOW': 'min',
+    'CLOSE': 'last',
+    'VOLUME': 'sum',
+    'DAILY_RETURN': 'mean',
+    'VOLATILITY_7': 'mean'
+}
+
+
+def _days(dates):
+    """Даты как число дней с 1970-01-01"""
+    return np.asarray(dates, dtype='datetime64[D]').astype(np.int64)
+
+
+def _week_start(days):
+    # 1970-01-01 - четверг: (days + 3) % 7 - номер дня недели, понедельник = 0
+    return days - (days + 3) % 7
+
+
+def _month_start(days, months=1):
+    month = np.asarray(days, dtype='datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    return (month - month % months).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+
+
+def _next_month_start(days, months):
+    month = np.asarray(days, dtype='datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    return (month - month % months + months).astype('datetime64[M]').astype('datetime64[D]').astype(np.int64)
+
+
+def bucket_starts(dates, resolution):
+    """Первый календарный день периода, в который попадает каждая дата"""
+    days = _days(dates)
+    if resolution in ('W', 'TW'):
+        return _week_start(days)
+    if resolution == 'M':
+        return _month_start(days)
+    if resolution == 'Q':
+        return _month_start(days, 3)
+    raise ValueError(f"Неизвестное разрешение: {resolution}")
+
+
+def bucket_labels(dates, resolution, calendar=None):
+    """
+    Метка периода для каждой даты (в днях с 1970-01-01)
+    
+    calendar: торговые дни (нужны для TW); по умолчанию - сами даты
+    """
+    days = _days(dates)
+    
+    if resolution == 'W':
+        return _week_start(days) + 6
+    if resolution == 'M':
+        return _next_month_start(days, 1) - 1
+    if resolution == 'Q':
+        return _next_month_start(days, 3) - 1
+    if resolution == 'TW':
+        calendar = np.unique(days if calendar is None else _days(calendar))
+        calendar_weeks = _week_start(calendar)
+        # Последний торговый день той же недели
+        last = np.searchsorted(calendar_weeks, _week_start(days), side='right') - 1
+        return calendar[last]
+    
+    raise ValueError(f"Неизвестное разрешение: {resolution}")
+
+
+def _result_dtype(dtype, func):
+    """Тип результата _reduce для колонки типа dtype"""
+    if func in ('first', 'last'):
+        return dtype
+    if func == 'sum' and dtype.kind in 'iu':
+        return np.dtype('int64')
+    if func in ('max', 'min') and dtype.kind == 'f':
+        return dtype
+    return np.dtype('float64')
+
+
+def _reduce(values, starts, func):
+    """Свертка значений по сегментам [starts[i], starts[i+1]) без учета NaN"""
+    n = len(values)
+    
+    if func in ('first', 'last'):
+        valid = ~pd.isna(values)
+        positions = np.arange(n)
+        if func == 'first':
+            pick = np.minimum.reduceat(np.where(valid, positions, n), starts)
+        else:
+            pick = np.maximum.reduceat(np.where(valid, positions, -1), starts)
+        found = (pick >= 0) & (pick < n)
+        result = values[np.clip(pick, 0, n - 1)]
+        if not found.all():
+            result = result.astype('float64')
+            result[~found] = np.nan
+        return result
+    
+    if values.dtype.kind in 'iu':
+        if func == 'sum':
+            return np.add.reduceat(values.astype(np.int64), starts)
+        values = values.astype('float64')
+    
+    if func == 'max':
+        return np.fmax.reduceat(values, starts)
+    if func == 'min':
+        return np.fmin.reduceat(values, starts)
+    
+    values = values.astype('float64')
+    valid = ~np.isnan(values)
+    total = np.add.reduceat(np.where(valid, values, 0.0), starts)
+    if func == 'sum':
+        return total
+    if func == 'mean':
+        count = np.add.reduceat(valid.astype(np.int64), starts)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.where(count > 0, total / np.maximum(count, 1), np.nan)
+    
+    raise ValueError(f"Неизвестная агрегация: {func}")
+
+
+def rollup_frame(df, resolutions=RESOLUTIONS, aggregations=None, calendar=None):
+    """
+    Агрегаты по периодам всех разрешений за один проход по отсортированным данным
+    
+    Фрейм один раз сортируется по (SECID, TRADEDATE); внутри бумаги метки
+    периода не убывают, поэтому каждый период - непрерывный сегмент строк,
+    и агрегаты считаются свертками numpy (reduceat) по границам сегментов.
+    Пустые периоды (без торгов) не выводятся.
+    Возвращает длинный фрейм: RESOLUTION, SECID, TRADEDATE (метка периода)
+    и агрегированные колонки.
+    """
+    aggregations = AGGREGATIONS if aggregations is None else aggregations
+    aggregations = {col: func for col, func in aggregations.items() if col in df.columns}
+    columns = ['RESOLUTION', 'SECID', 'TRADEDATE'] + list(aggregations)
+    
+    df = sort_by_security(df)
+    if df.empty:
+        empty = pd.DataFrame({
+            'RESOLUTION': pd.Series(dtype='object'),
+            'SECID': df['SECID'].iloc[:0],
+            'TRADEDATE': pd.Series(dtype='datetime64[ns]'),
+        })
+        for col, func in aggregations.items():
+            empty[col] = pd.Series(dtype=_result_dtype(df[col].dtype, func))
+        return empty[columns]
+    
+    keys = _key_values(df['SECID'])
+    new_security = np.ones(len(df), dtype=bool)
+    new_security[1:] = keys[1:] != keys[:-1]
+    
+    values = {col: df[col].to_numpy() for col in aggregations}
+    
+    parts = []
+    for resolution in resolutions:
+        labels = bucket_labels(df['TRADEDATE'].to_numpy(), resolution, calendar)
+        
+        first = new_security.copy()
+        first[1:] |= labels[1:] != labels[:-1]
+        starts = np.flatnonzero(first)
+        
+        part = pd.DataFrame({
+            'SECID': df['SECID'].iloc[starts].reset_index(drop=True),
+            'TRADEDATE': labels[starts].astype('datetime64[D]').astype('datetime64[ns]'),
+        })
+        for col, func in aggregations.items():
+            part[col] = _reduce(values[col], starts, func)
+        
+        part.insert(0, 'RESOLUTION', resolution)
+        parts.append(part)
+    
+    return pd.concat(parts, ignore_index=True)[columns]
+
+
+def split_rollups(frame, resolutions=RESOLUTIONS):
+    """Длинный фрейм rollup_frame -> {разрешение: фрейм}"""
+    return {
+        resolution: frame[frame['RESOLUTION'] == resolution]
+            .drop(columns='RESOLUTION')
+            .reset_index(drop=True)
+        for resolution in resolutions
+    }
+
+
+def rollup(df, resolutions=RESOLUTIONS, aggregations=None, calendar=None):
+    """Агрегаты по периодам: {разрешение: фрейм SECID, TRADEDATE, ...}"""
+    return split_rollups(rollup_frame(df, resolutions, aggregations, calendar), resolutions)
@@ -1,183 +1,783 @@
+import dask
 import dask.dataframe as dd
 import pandas as pd
 from dask.distributed import Client
 import numpy as np
+import cloudpickle
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dask_jobs import indicators, parallel, rollup
+from dask_jobs.metrics import instrumented
+from dask_jobs.indicators import compute_indicators, sort_by_security, StreamingIndicators
+from storage.indicator_state import IndicatorState
+from storage.parquet_store import ParquetStore, compact_types
+from storage.raw_store import RawDataStore
+
+# Датасеты агрегатов по разрешениям (см. dask_jobs/rollup.py)
+ROLLUP_OUTPUTS = {
+    'W': 'data/moex_processed_weekly',
+    'M': 'data/moex_processed_monthly',
+    'Q': 'data/moex_processed_quarterly',
+    'TW': 'data/moex_processed_trading_weekly',
+}
+
+# Сводка файлов, записанных воркерами
+FILES_META = pd.DataFrame({'output': pd.Series(dtype='object'), 'path': pd.Series(dtype='object')})
+
+
+def write_partition_files(df, targets, split_column=None):
+    """
+    Записать партицию в версии датасетов (выполняется на воркере)
+    
+    targets: {ключ: каталог версии}
+    split_column: колонка, значения которой - ключи targets (строки делятся
+                  между датасетами); None - все строки в единственный датасет
+    Возвращает сводку записанных файлов: output, path.
+    """
+    records = []
+    for key, version_dir in targets.items():
+        part = df if split_column is None else df[df[split_column] == key].drop(columns=split_column)
+        for path in ParquetStore(version_dir).append(part):
+            records.append((key, path))
+    
+    return pd.DataFrame(records, columns=list(FILES_META.columns))
+
+
+def write_versions(frames, outputs):
+    """
+    Записать фреймы в новые версии датасетов и опубликовать их вместе
+    
+    frames, outputs: {ключ: фрейм}, {ключ: путь к датасету}
+    """
+    versions = {}
+    for key, path in outputs.items():
+        version_dir = ParquetStore(path).new_version()
+        versions[key] = (version_dir, ParquetStore(version_dir).append(frames[key]))
+    
+    for key, (version_dir, files) in versions.items():
+        ParquetStore(outputs[key]).commit(version_dir, files=files, rows=len(frames[key]))
+
+
+def clean_frame(df):
+    """Удалить неполные строки и дубликаты (SECID, TRADEDATE), отсортировать по бумагам"""
+    df = df.dropna(subset=['CLOSE', 'OPEN', 'HIGH', 'LOW', 'VOLUME'])
+    df = df.drop_duplicates(subset=['TRADEDATE', 'SECID'])
+    return df.sort_values(['SECID', 'TRADEDATE'])
+
 
 class MOEXDataProcessor:
     """Класс для обработки данных с использованием Dask"""
     
-    def __init__(self, input_file, use_dask_cluster=False, scheduler_address=None):
+    KEYS = ['SECID', 'TRADEDATE']
+    # Колонки, без которых не работают очистка и недельная агрегация
+    BASE_COLUMNS = ['TRADEDATE', 'SECID', 'OPEN', 'HIGH', 'LOW', 'CLOSE', 'VOLUME']
+    # Во сколько раз обработка (индикаторы, копии фрейма) больше самих данных
+    MEMORY_FACTOR = 3
+    
+    def __init__(self, input_file, use_dask_cluster=False, scheduler_address=None, since=None,
+                 indicator_names=None, columns=None, memory_budget_mb=None, resolutions=None,
+                 mode=None, metrics=None, secids=None):
         """
         Инициализация процессора
         
-        input_file: путь к CSV файлу
+        input_file: путь к Parquet-датасету (папке), CSV файлу или уже
+                    загруженный pandas DataFrame (например, собранный из частей)
         use_dask_cluster: использовать ли Dask кластер
         scheduler_address: адрес Dask scheduler (например, 'localhost:8786')
+        since: {SECID: Timestamp} - загрузить только строки новее этих отметок
+               (инкрементальный режим, только Parquet-датасет и Pandas)
+        indicator_names: индикаторы, которые будут считаться (по умолчанию -
+                         DEFAULT_INDICATORS); по ним выбираются колонки загрузки
+        columns: явный список загружаемых колонок вместо профиля по индикаторам
+        memory_budget_mb: бюджет памяти; если данные в него не помещаются,
+                          обработка идет через Dask вне памяти
+        resolutions: разрешения агрегатов (по умолчанию - rollup.RESOLUTIONS)
+        mode: режим без внешнего кластера (parallel.MODES): 'pandas',
+              'processes' (пул процессов по бумагам), 'local' (LocalCluster
+              по размеру машины), 'dask' (локальный планировщик вне памяти)
+              или 'auto' - выбор по объему данных;
+              None - Pandas. Если кластер недоступен, режим выбирается
+              автоматически.
+        metrics: PipelineMetrics - записывать метрики загрузки и каждого этапа
+        secids: загрузить только эти бумаги (только Parquet-датасет)
         """
+        self.metrics = metrics
+        self.secids = None if secids is None else list(secids)
         self.use_dask_cluster = use_dask_cluster
         self.client = None
+        self.cluster = None
+        self.pool = None
+        self.workers = 1
         
         if use_dask_cluster and scheduler_address:
-            try:
-                # Подключение к Dask кластеру
-                self.client = Client(scheduler_address)
-                print(f"✅ Подключено к Dask кластеру: {scheduler_address}")
-                print(f"Dashboard: {self.client.dashboard_link}")
-            except Exception as e:
-                print(f"⚠️ Не удалось подключиться к Dask кластеру: {e}")
-                print("Использую локальные вычисления")
+            if not self._connect(scheduler_address):
+                print("Режим обработки будет выбран автоматически")
                 self.use_dask_cluster = False
+                mode = 'auto'
+        
+        self.indicator_names = (
+            indicators.DEFAULT_INDICATORS if indicator_names is None else list(indicator_names)
+        )
+        self.columns = list(columns) if columns is not None else self.load_columns(self.indicator_names)
+        self.resolutions = rollup.RESOLUTIONS if resolutions is None else list(resolutions)
+        
+        if mode == 'auto' and not self.use_dask_cluster:
+            mode = self._auto_mode(input_file, since, memory_budget_mb)
+        if mode == 'local' and not self.use_dask_cluster:
+            cores, memory_mb = parallel.machine_resources()
+            self.cluster = parallel.start_local_cluster(cores, memory_budget_mb or memory_mb)
+            self.use_dask_cluster = self._connect(self.cluster)
+        elif mode == 'processes' and not self.use_dask_cluster:
+            self.workers, _ = parallel.machine_resources()
+            self.pool = parallel.start_pool(self.workers)
         
         # Загрузка данных
+        is_dataset = not isinstance(input_file, pd.DataFrame) and os.path.isdir(input_file)
+        # Лежат ли все строки каждой бумаги в одной партиции Dask
+        self.secid_aligned = False
+        # Результаты Dask-плана, посчитанные одним проходом (см. materialize)
+        self._results = None
+        
+        # self.df - Dask-фрейм: на кластере или если данные не помещаются в память
+        self.use_dask = self.use_dask_cluster or mode == 'dask'
+        if not self.use_dask and memory_budget_mb and since is None:
+            estimate = self.estimate_memory_mb(input_file, self.columns, self.indicator_names)
+            if estimate > memory_budget_mb:
+                print(f"💾 Оценка {estimate:.0f} МБ больше бюджета {memory_budget_mb} МБ: "
+                      f"обработка через Dask вне памяти")
+                self.use_dask = True
+        
+        self._load(input_file, is_dataset, since)
+        
+        # Число партиций при загрузке - ориентир для перераспределения по SECID
+        self.npartitions = self.df.npartitions if self.use_dask else 1
+        print(f"🧭 Режим обработки: {self.mode}")
+    
+    @property
+    def mode(self):
+        """Фактический режим обработки"""
+        if self.cluster is not None:
+            return f"local ({len(self.cluster.workers)} воркеров LocalCluster)"
         if self.use_dask_cluster:
+            return 'cluster'
+        if self.use_dask:
+            return 'dask (вне памяти)'
+        if self.pool is not None:
+            return f"processes ({self.workers} процессов)"
+        return 'pandas'
+    
+    def _connect(self, address):
+        """Подключиться к Dask-кластеру: адрес scheduler или LocalCluster"""
+        try:
+            # Подключение к Dask кластеру
+            self.client = Client(address)
+        except Exception as e:
+            print(f"⚠️ Не удалось подключиться к Dask кластеру: {e}")
+            return False
+        
+        print(f"✅ Подключено к Dask кластеру: {self.client.scheduler.address}")
+        print(f"Dashboard: {self.client.dashboard_link}")
+        # На воркерах нет модулей проекта - код индикаторов
+        # и агрегаций передается вместе с задачами
+        cloudpickle.register_pickle_by_value(indicators)
+        cloudpickle.register_pickle_by_value(rollup)
+        cloudpickle.register_pickle_by_value(sys.modules[ParquetStore.__module__])
+        cloudpickle.register_pickle_by_value(sys.modules[__name__])
+        if self.metrics is not None:
+            self.metrics.attach(self.client)
+        return True
+    
+    def _auto_mode(self, input_file, since, memory_budget_mb):
+        """Выбрать режим по оценке памяти, числу ядер и свободной памяти"""
+        if since is not None:
+            # Инкрементальный запуск обрабатывает только новые строки
+            return 'pandas'
+        
+        cores, memory_mb = parallel.machine_resources()
+        if memory_budget_mb:
+            memory_mb = min(memory_mb, memory_budget_mb)
+        estimate = self.estimate_memory_mb(input_file, self.columns, self.indicator_names)
+        
+        mode = parallel.choose_mode(estimate, cores, memory_mb)
+        print(f"🧭 Оценка {estimate:.0f} МБ, {cores} ядер, {memory_mb:.0f} МБ свободно: режим {mode}")
+        return mode
+    
+    @instrumented
+    def _load(self, input_file, is_dataset, since):
+        """Загрузить данные в self.df (Pandas или Dask - по self.use_dask)"""
+        if isinstance(input_file, pd.DataFrame) and self.use_dask:
+            cores, _ = parallel.machine_resources()
+            self.df = dd.from_pandas(input_file, npartitions=cores)
+            print(f"Данные переданы фреймом: {len(input_file)} строк, {self.df.npartitions} партиций Dask")
+        elif isinstance(input_file, pd.DataFrame):
+            self.df = input_file
+            print(f"Данные переданы фреймом: {len(self.df)} строк")
+        elif self.use_dask and is_dataset:
+            # Одна партиция на бумагу: перераспределение по SECID не нужно.
+            # Функции по бумагам работают с SECID-колонкой, а не с индексом
+            self.df = ParquetStore(input_file).read_dask(
+                columns=self.columns, secids=self.secids, index=None
+            )
+            self.secid_aligned = True
+            print(f"Данные загружены через Dask: {self.df.npartitions} партиций")
+        elif self.use_dask:
             # Загружаем через Dask для параллельной обработки
             self.df = dd.read_csv(
                 input_file,
+                usecols=self.columns,
                 parse_dates=['TRADEDATE'],
-                dtype={
-                    'SECID': 'object',
-                    'TRADE_SESSION_DATE': 'object'  # Добавьте эту строку
-                },
+                dtype={'SECID': 'object'},
                 blocksize='64MB'
             )
-
+            
             print(f"Данные загружены через Dask: {self.df.npartitions} партиций")
+        elif is_dataset and since is not None:
+            self.df = compact_types(
+                RawDataStore(input_file).load_new(since, columns=self.columns, secids=self.secids)
+            )
+            print(f"Загружены новые строки из Parquet: {len(self.df)} строк")
+        elif is_dataset:
+            self.df = compact_types(ParquetStore(input_file).read(columns=self.columns, secids=self.secids))
+            print(f"Данные загружены из Parquet: {len(self.df)} строк")
         else:
             # Загружаем через pandas
-            self.df = pd.read_csv(input_file, parse_dates=['TRADEDATE'])
+            self.df = compact_types(pd.read_csv(
+                input_file,
+                usecols=lambda col: col in self.columns,
+                parse_dates=['TRADEDATE']
+            ))
             print(f"Данные загружены через Pandas: {len(self.df)} строк")
     
+    def row_count(self):
+        """Число строк self.df, если оно известно без вычислений (для метрик)"""
+        df = getattr(self, 'df', None)
+        if df is None:
+            return None
+        if not self.use_dask:
+            return len(df)
+        return int(self._results['rows']) if self._results is not None else None
+    
+    @classmethod
+    def load_columns(cls, names=None):
+        """Профиль загрузки: колонки, нужные очистке, агрегации и индикаторам names"""
+        extra = [col for col in indicators.input_columns(names) if col not in cls.BASE_COLUMNS]
+        return cls.BASE_COLUMNS + extra
+    
+    @classmethod
+    def estimate_memory_mb(cls, input_file, columns, names=None):
+        """
+        Оценка памяти на обработку в Pandas, МБ
+        
+        Для Parquet - по числу строк из метаданных (8 байт на колонку
+        и на каждый индикатор), для CSV - по размеру файла, для фрейма -
+        по его памяти с индикаторами (8 байт на строку на каждый).
+        """
+        if isinstance(input_file, pd.DataFrame):
+            width = len(indicators.output_columns(names))
+            data_mb = (input_file.memory_usage(deep=True).sum() + len(input_file) * width * 8) / 1024**2
+        elif os.path.isdir(input_file):
+            rows = ParquetStore(input_file).count_rows()
+            width = len(columns) + len(indicators.output_columns(names))
+            data_mb = rows * width * 8 / 1024**2
+        else:
+            data_mb = os.path.getsize(input_file) / 1024**2
+        
+        return data_mb * cls.MEMORY_FACTOR
+    
+    @instrumented
     def clean_data(self):
         """Очистка данных"""
         print("Очистка данных...")
+        self._results = None
         
-        if self.use_dask_cluster:
+        if self.use_dask:
             # Dask версия
-            self.df = self.df.dropna(subset=['CLOSE', 'OPEN', 'HIGH', 'LOW', 'VOLUME'])
-            self.df = self.df.drop_duplicates(subset=['TRADEDATE', 'SECID'])
-            # Сортировка в Dask
-            self.df = self.df.set_index('TRADEDATE').reset_index()
+            if not self.secid_aligned:
+                # CSV: один раз собираем строки каждой бумаги в одной партиции
+                self.df = self.df.shuffle('SECID', npartitions=self.npartitions)
+                self.secid_aligned = True
+            # Бумага целиком в одной партиции - дубликаты и сортировка
+            # обрабатываются внутри партиций, без обмена данными
+            self.df = self.df.map_partitions(clean_frame, meta=self.df._meta)
         else:
             # Pandas версия
-            self.df = self.df.dropna(subset=['CLOSE', 'OPEN', 'HIGH', 'LOW', 'VOLUME'])
-            self.df = self.df.drop_duplicates(subset=['TRADEDATE', 'SECID'])
-            self.df = self.df.sort_values(['SECID', 'TRADEDATE'])
+            self.df = clean_frame(self.df)
         
         return self
     
-    def calculate_indicators(self):
-        """Расчет технических индикаторов"""
-        print("Расчет индикаторов...")
+    @instrumented
+    def calculate_indicators(self, names=None):
+        """
+        Расчет технических индикаторов
         
-        if self.use_dask_cluster:
-            # Для Dask: преобразуем в pandas для сложных операций
-            # (rolling операции в Dask сложны, поэтому делаем compute)
-            print("⚠️ Преобразование в Pandas для расчета индикаторов...")
-            df_pandas = self.df.compute()
-            
-            def calculate_for_security(group):
-                group = group.sort_values('TRADEDATE')
-                
-                group['DAILY_RETURN'] = group['CLOSE'].pct_change() * 100
-                group['MA_7'] = group['CLOSE'].rolling(window=7, min_periods=1).mean()
-                group['MA_30'] = group['CLOSE'].rolling(window=30, min_periods=1).mean()
-                group['VOLATILITY_7'] = group['DAILY_RETURN'].rolling(window=7, min_periods=1).std()
-                group['VOLUME_CHANGE'] = group['VOLUME'].pct_change() * 100
-                
-                return group
-            
-            df_pandas = df_pandas.groupby('SECID', group_keys=False).apply(calculate_for_security)
-            
-            # Конвертируем обратно в Dask с большим количеством партиций
-            self.df = dd.from_pandas(df_pandas, npartitions=10)
-            print(f"✅ Индикаторы рассчитаны, создано {self.df.npartitions} партиций")
+        names: имена индикаторов из реестра dask_jobs.indicators
+               (по умолчанию - indicator_names процессора)
+        """
+        names = self.indicator_names if names is None else list(names)
+        print(f"Расчет индикаторов: {', '.join(indicators.output_columns(names))}...")
+        self._results = None
+        
+        if self.use_dask:
+            # Для Dask: каждая бумага целиком попадает в одну партицию,
+            # индикаторы считаются на воркерах, результат остается распределенным
+            if not self.secid_aligned:
+                self.df = self.df.shuffle('SECID', npartitions=self.npartitions)
+                self.secid_aligned = True
             
+            meta = compute_indicators(self.df._meta, names)
+            self.df = self.df.map_partitions(compute_indicators, names, meta=meta)
+            print(f"✅ Индикаторы рассчитаны на воркерах: {self.df.npartitions} партиций")
+        
+        elif self.pool is not None:
+            # Пул процессов: каждый считает свои бумаги целиком
+            parts = parallel.map_shards(self.pool, compute_indicators, self.df, self.workers, names)
+            self.df = sort_by_security(pd.concat(parts, ignore_index=True))
+            print(f"✅ Индикаторы рассчитаны в {len(parts)} процессах")
         else:
-            # Pandas версия (как раньше)
-            def calculate_for_security(group):
-                group = group.sort_values('TRADEDATE')
-                
-                group['DAILY_RETURN'] = group['CLOSE'].pct_change() * 100
-                group['MA_7'] = group['CLOSE'].rolling(window=7, min_periods=1).mean()
-                group['MA_30'] = group['CLOSE'].rolling(window=30, min_periods=1).mean()
-                group['VOLATILITY_7'] = group['DAILY_RETURN'].rolling(window=7, min_periods=1).std()
-                group['VOLUME_CHANGE'] = group['VOLUME'].pct_change() * 100
-                
-                return group
-            
-            self.df = self.df.groupby('SECID', group_keys=False).apply(calculate_for_security)
+            # Pandas версия: один проход по отсортированным данным
+            self.df = compute_indicators(self.df, names)
+        
+        return self
+    
+    @instrumented
+    def calculate_indicators_incremental(self, state, names=None):
+        """
+        Досчитать индикаторы только для загруженных (новых) строк
+        
+        state: IndicatorState с состоянием индикаторов по каждой бумаге
+               на момент прошлой обработки; обновляется на месте
+        Стоимость пропорциональна числу новых строк, а не длине истории.
+        """
+        names = self.indicator_names if names is None else list(names)
+        print(f"Инкрементальный расчет индикаторов: {len(self.df)} новых строк...")
         
+        streaming = StreamingIndicators(names)
+        streaming.states = state.states
+        
+        self.df = sort_by_security(self.df)
+        values = streaming.update_frame(self.df)
+        self.df = pd.concat([self.df, values], axis=1)
+        
+        state.update(names, streaming.states, {**state.watermarks, **self._last_dates(self.df)})
+        return self
+    
+    @instrumented
+    def build_state(self, state, names=None):
+        """
+        Построить состояние индикаторов по всей загруженной истории
+        
+        Нужно после полного пересчета, чтобы следующие запуски
+        могли работать инкрементально.
+        """
+        names = self.indicator_names if names is None else list(names)
+        
+        if self.use_dask:
+            results = self.materialize(state_names=names)
+            states, last_dates = results['states'], results['last_dates']
+        elif self.pool is not None:
+            states, last_dates = {}, {}
+            for part_states, part_dates in parallel.map_shards(
+                self.pool, self._partition_state, self.df, self.workers, names
+            ):
+                states.update(part_states)
+                last_dates.update(part_dates)
+        else:
+            states, last_dates = self._partition_state(self.df, names)
+        
+        state.update(names, states, last_dates)
+        print(f"✅ Состояние индикаторов построено для {len(states)} бумаг")
         return self
     
+    @classmethod
+    def _partition_state(cls, df, names):
+        """
+        Состояние индикаторов и последние даты по бумагам фрейма
+        
+        Состояние строится по уже посчитанным векторно индикаторам
+        (StreamingIndicators.seed_frame), а не прогоном всей истории
+        через онлайн-формулы.
+        """
+        columns = cls.KEYS + indicators.input_columns(names)
+        columns += [col for col in indicators.output_columns(names) if col in df.columns]
+        df = sort_by_security(df[columns])
+        
+        streaming = StreamingIndicators(names)
+        streaming.seed_frame(df)
+        return streaming.states, cls._last_dates(df)
+    
+    @staticmethod
+    def _last_dates(df):
+        if df.empty:
+            return {}
+        return df.groupby('SECID', observed=True)['TRADEDATE'].max().to_dict()
+    
+    @instrumented
+    def materialize(self, state_names=None, outputs=None):
+        """
+        Посчитать все результаты Dask-плана одним dask.compute
+        
+        Дневная таблица, агрегаты по периодам, статистика и (если передан
+        state_names) состояние индикаторов строятся лениво из одного графа
+        и считаются вместе: чтение, очистка, перераспределение по SECID
+        и индикаторы выполняются один раз. get_statistics, save_results,
+        aggregate и build_state берут готовые результаты.
+        
+        outputs: {'daily' или разрешение агрегата: путь к датасету} - такие
+                 результаты не собираются на клиенте: воркеры пишут свои
+                 партиции в новые версии датасетов, а после записи всех
+                 данных версии публикуются заменой манифестов
+        В режиме Pandas считать нечего - возвращает None.
+        """
+        if not self.use_dask:
+            return None
+        
+        outputs = dict(outputs or {})
+        
+        if self._results is not None:
+            if state_names is not None and 'states' not in self._results:
+                # План уже посчитан без состояния - строим его по готовой
+                # дневной таблице, не запуская граф повторно
+                states, last_dates = self._partition_state(self._result_frame('daily'), state_names)
+                self._results.update(states=states, last_dates=last_dates)
+            # Датасеты, уже записанные воркерами по тем же путям, не переписываются
+            written = self._results['outputs']
+            outputs = {key: path for key, path in outputs.items() if written.get(key) != path}
+            if outputs:
+                # Остальные результаты пишем с клиента
+                write_versions({key: self._result_frame(key) for key in outputs}, outputs)
+                written.update(outputs)
+            return self._results
+        
+        print("⚙️ Один проход Dask: дневные данные, агрегаты, статистика")
+        versions = {key: ParquetStore(path).new_version() for key, path in outputs.items()}
+        
+        plan = {
+            'rows': self.df.shape[0],
+            'memory': self.df.memory_usage(deep=True).sum(),
+        }
+        
+        if 'daily' in versions:
+            plan['daily_files'] = self.df.map_partitions(
+                write_partition_files, {'daily': versions['daily']}, meta=FILES_META
+            )
+        else:
+            plan['daily'] = self.df
+        
+        rollups = self._rollup_plan()
+        rollup_versions = {res: versions[res] for res in self.resolutions if res in versions}
+        if rollup_versions:
+            plan['rollup_files'] = rollups.map_partitions(
+                write_partition_files, rollup_versions, 'RESOLUTION', meta=FILES_META
+            )
+        if len(rollup_versions) < len(self.resolutions):
+            plan['rollups'] = rollups
+        
+        if state_names is not None:
+            # После расчета индикаторов каждая бумага целиком в одной партиции
+            plan['partition_states'] = [
+                dask.delayed(self._partition_state)(part, list(state_names))
+                for part in self.df.to_delayed()
+            ]
+        
+        (results,) = dask.compute(plan)
+        
+        # Агрегаты, не записанные воркерами, возвращаются клиенту
+        results['rollups'] = {
+            res: table
+            for res, table in rollup.split_rollups(results['rollups'], self.resolutions).items()
+            if res not in rollup_versions
+        } if 'rollups' in results else {}
+        
+        if state_names is not None:
+            results['states'], results['last_dates'] = {}, {}
+            for states, last_dates in results.pop('partition_states'):
+                results['states'].update(states)
+                results['last_dates'].update(last_dates)
+        
+        # Все данные записаны - публикуем версии
+        files = pd.concat([results.pop(key) for key in ('daily_files', 'rollup_files') if key in results]) \
+            if versions else FILES_META
+        for key, version_dir in versions.items():
+            paths = files.loc[files['output'] == key, 'path'].tolist()
+            ParquetStore(outputs[key]).commit(version_dir, files=paths)
+        
+        results['outputs'] = outputs
+        self._results = results
+        return results
+    
+    def _result_frame(self, key):
+        """
+        Результат materialize на клиенте: 'daily' или разрешение агрегата
+        
+        Результаты, записанные воркерами сразу в датасеты, читаются оттуда.
+        """
+        results = self._results
+        frames = {'daily': results.get('daily'), **results.get('rollups', {})}
+        if frames.get(key) is not None:
+            return frames[key]
+        if key in results['outputs']:
+            return ParquetStore(results['outputs'][key]).read()
+        raise ValueError(f"Результат '{key}' не посчитан в materialize")
+    
+    def _rollup_plan(self):
+        """Ленивые агрегаты всех разрешений по партициям, выровненным по SECID"""
+        df = self.df
+        if not self.secid_aligned:
+            df = df.shuffle('SECID', npartitions=self.npartitions)
+        
+        # Торговый календарь общий для всех партиций (нужен для TW)
+        calendar = None
+        if 'TW' in self.resolutions:
+            calendar = dask.delayed(np.asarray)(df['TRADEDATE'].unique())
+        
+        meta = rollup.rollup_frame(df._meta, self.resolutions)
+        return df.map_partitions(rollup.rollup_frame, self.resolutions, None, calendar, meta=meta)
+    
+    @instrumented
+    def aggregate(self, resolutions=None):
+        """
+        Агрегаты OHLCV по периодам: {разрешение: фрейм}
+        
+        resolutions: подмножество self.resolutions (по умолчанию - все)
+        """
+        resolutions = self.resolutions if resolutions is None else list(resolutions)
+        print(f"Агрегация по периодам: {', '.join(resolutions)}...")
+        
+        if self.use_dask:
+            # Агрегаты посчитаны вместе с остальным планом; записанные
+            # воркерами сразу в датасеты читаются оттуда
+            self.materialize()
+            return {res: self._result_frame(res) for res in resolutions}
+        
+        return self._rollup_pandas(resolutions)
+    
+    def _rollup_pandas(self, resolutions):
+        """Агрегаты Pandas-фрейма; в пуле процессов - по частям бумаг"""
+        if self.pool is None:
+            return rollup.rollup(self.df, resolutions)
+        
+        # Календарь торговых недель общий для всех частей
+        calendar = self.df['TRADEDATE'].unique()
+        parts = parallel.map_shards(
+            self.pool, rollup.rollup_frame, self.df, self.workers, resolutions, None, calendar
+        )
+        return rollup.split_rollups(pd.concat(parts, ignore_index=True), resolutions)
+    
     def aggregate_weekly(self):
         """Агрегация по неделям"""
-        print("Агрегация по неделям...")
+        return self.aggregate(['W'])['W']
+    
+    @instrumented
+    def refresh_rollups(self, daily_output, outputs):
+        """
+        Пересчитать только периоды, в которые попали новые строки
         
-        if self.use_dask_cluster:
-            # Compute для агрегации
-            df_computed = self.df.compute()
-        else:
-            df_computed = self.df.copy()
+        outputs: {разрешение: путь к датасету агрегатов}
+        Для каждого разрешения дневные данные затронутых бумаг читаются
+        с начала самого раннего затронутого периода, поэтому периоды
+        агрегируются целиком и заменяют прежние строки этих периодов.
+        """
+        if self.df.empty:
+            return 0
         
-        df_computed.set_index('TRADEDATE', inplace=True)
+        secids = [str(secid) for secid in self.df['SECID'].unique()]
+        first = self.df['TRADEDATE'].min()
+        starts = {
+            resolution: pd.Timestamp(rollup.bucket_starts([first], resolution)[0], unit='D')
+            for resolution in outputs
+        }
+        start = min(starts.values())
         
-        weekly = df_computed.groupby('SECID').resample('W').agg({
-            'OPEN': 'first',
-            'HIGH': 'max',
-            'LOW': 'min',
-            'CLOSE': 'last',
-            'VOLUME': 'sum',
-            'DAILY_RETURN': 'mean',
-            'VOLATILITY_7': 'mean'
-        }).reset_index()
+        store = ParquetStore(daily_output)
+        columns = [col for col in self.KEYS + list(rollup.AGGREGATIONS) if col in store.columns()]
+        daily = store.read(columns=columns, secids=secids, start=start)
+        # Календарь - по всем бумагам, а не только по обновленным
+        calendar = store.read(columns=['TRADEDATE'], start=start)['TRADEDATE'].unique()
         
-        if not self.use_dask_cluster:
-            self.df.reset_index(inplace=True)
+        rows = 0
+        for resolution, output in outputs.items():
+            part = daily[daily['TRADEDATE'] >= starts[resolution]]
+            result = rollup.rollup(part, [resolution], calendar=calendar)[resolution]
+            ParquetStore(output).replace_range(result, secids, starts[resolution])
+            rows += len(result)
         
-        return weekly
+        print(f"✅ Обновлено периодов: {rows} ({', '.join(outputs)})")
+        return rows
+    
+    @staticmethod
+    def write_table(df, output):
+        """Записать таблицу: *.csv - одним файлом, иначе - в Parquet-датасет"""
+        if output.endswith('.csv'):
+            df.to_csv(output, index=False)
+        else:
+            ParquetStore(output).overwrite(df)
     
-    def save_results(self, daily_output, weekly_output=None):
-        """Сохранение результатов"""
+    @instrumented
+    def save_results(self, daily_output, weekly_output=None, append=False, rollup_outputs=None,
+                     state_names=None):
+        """
+        Сохранение результатов
+        
+        weekly_output: датасет недельных агрегатов
+        rollup_outputs: {разрешение: путь} - датасеты агрегатов других разрешений
+        append: дописать строки в существующий датасет (upsert по SECID и дате)
+                вместо полной перезаписи
+        state_names: в режиме Dask заодно построить состояние этих индикаторов
+        
+        Дневные данные и агрегаты пишутся одной операцией в новые версии
+        датасетов и публикуются вместе после записи всех данных.
+        """
         print("Сохранение результатов...")
         
-        if self.use_dask_cluster:
-            # Для Dask: сохраняем параллельно
+        if append:
+            if self.df.empty:
+                print("Новых строк нет")
+                return
+            ParquetStore(daily_output).upsert(self.df, keys=self.KEYS)
+            print(f"✅ Дописано строк: {len(self.df)} в {daily_output}")
+            return
+        
+        outputs = {'daily': daily_output}
+        if weekly_output:
+            outputs['W'] = weekly_output
+        outputs.update(rollup_outputs or {})
+        
+        # CSV пишется одним файлом с клиента
+        csv_outputs = {key: path for key, path in outputs.items() if path.endswith('.csv')}
+        dataset_outputs = {key: path for key, path in outputs.items() if key not in csv_outputs}
+        
+        if self.use_dask:
+            # Для Dask: каждый воркер пишет свои партиции
             print("💾 Сохранение через Dask (параллельно)...")
-            
-            # Compute и сохраняем
-            df_computed = self.df.compute()
-            df_computed.to_csv(daily_output, index=False)
-            
-            print(f"✅ Дневные данные сохранены: {daily_output}")
+            self.materialize(state_names, outputs=dataset_outputs)
+            frames = {key: self._result_frame(key) for key in csv_outputs}
         else:
             # Pandas версия
-            self.df.to_csv(daily_output, index=False)
-            print(f"✅ Дневные данные сохранены: {daily_output}")
+            frames = {'daily': self.df}
+            resolutions = [key for key in outputs if key != 'daily']
+            if resolutions:
+                frames.update(self._rollup_pandas(resolutions))
+            write_versions({key: frames[key] for key in dataset_outputs}, dataset_outputs)
+        
+        for key, path in csv_outputs.items():
+            self.write_table(frames[key], path)
+        
+        print(f"✅ Сохранено: {', '.join(outputs.values())}")
     
     def get_statistics(self):
         """Получить статистику обработки"""
-        if self.use_dask_cluster:
+        if self.use_dask:
+            results = self.materialize()
             stats = {
-                'total_rows': len(self.df),
+                'total_rows': int(results['rows']),
                 'partitions': self.df.npartitions,
-                'memory_usage': self.df.memory_usage(deep=True).sum().compute() / 1024**2,
-                'cluster_info': str(self.client) if self.client else 'No cluster'
+                'memory_usage': results['memory'] / 1024**2,
+                'cluster_info': str(self.client) if self.client else 'Local Dask (out-of-core)',
+                'mode': self.mode
             }
         else:
             stats = {
                 'total_rows': len(self.df),
-                'partitions': 1,
+                'partitions': self.workers,
                 'memory_usage': self.df.memory_usage(deep=True).sum() / 1024**2,
-                'cluster_info': 'Local pandas'
+                'cluster_info': 'Local pandas',
+                'mode': self.mode
             }
         
         return stats
     
     def close(self):
-        """Закрыть соединение с кластером"""
+        """Закрыть соединение с кластером, LocalCluster и пул процессов"""
         if self.client:
             self.client.close()
             print("✅ Соединение с Dask кластером закрыто")
+        if self.cluster is not None:
+            self.cluster.close()
+        if self.pool is not None:
+            self.pool.shutdown()
+
+
+def process_shard(input_file, secids, names=None, state=None):
+    """
+    Очистка и индикаторы для части бумаг (одна задача конвейера)
+    
+    Читаются только партиции бумаг secids, поэтому часть можно обрабатывать,
+    пока другие бумаги еще загружаются.
+    state: IndicatorState прошлого запуска - досчитать только новые строки;
+           None - полный пересчет истории бумаг
+    Возвращает (фрейм с индикаторами, IndicatorState части в памяти).
+    """
+    names = indicators.DEFAULT_INDICATORS if names is None else list(names)
+    shard_state = IndicatorState(None)
+    
+    if state is not None:
+        wanted = {str(secid) for secid in secids}
+        since = {secid: date for secid, date in state.watermarks.items() if secid in wanted}
+        states = {secid: value for secid, value in state.states.items() if secid in wanted}
+        shard_state.update(names, states, since)
+        
+        processor = MOEXDataProcessor(input_file, since=since, indicator_names=names, secids=secids)
+        processor.clean_data().calculate_indicators_incremental(shard_state, names)
+    else:
+        processor = MOEXDataProcessor(input_file, indicator_names=names, secids=secids)
+        processor.clean_data().calculate_indicators().build_state(shard_state, names)
+    
+    return processor.df, shard_state
+
+
+def merge_shards(shards):
+    """
+    Собрать результаты process_shard: (фрейм, состояния, watermark'и)
+    
+    Фрейм упорядочен по бумагам, как после обработки целиком.
+    """
+    df = sort_by_security(pd.concat([df for df, _ in shards], ignore_index=True))
+    
+    states, watermarks = {}, {}
+    for _, shard_state in shards:
+        states.update(shard_state.states)
+        watermarks.update(shard_state.watermarks)
+    
+    return df, states, watermarks
+
+
+def verify_incremental(input_file, daily_output, names=None, rtol=1e-7, atol=1e-9):
+    """
+    Сверить сохраненные дневные индикаторы с полным пересчетом
+    
+    Полный пересчет делается векторно по всей сырой истории. Онлайн-формулы
+    совпадают с векторными с точностью до ошибок округления, поэтому
+    сравнение идет с допуском (np.allclose, NaN == NaN).
+    Возвращает {колонка: совпадает ли}.
+    """
+    names = indicators.DEFAULT_INDICATORS if names is None else list(names)
+    columns = indicators.output_columns(names)
+    
+    full = MOEXDataProcessor(input_file, indicator_names=names).clean_data().calculate_indicators().df
+    stored = ParquetStore(daily_output).read(columns=MOEXDataProcessor.KEYS + columns)
+    
+    merged = full[MOEXDataProcessor.KEYS + columns].merge(
+        stored, on=MOEXDataProcessor.KEYS, how='outer', suffixes=('_full', '_stored')
+    )
+    
+    result = {}
+    for col in columns:
+        result[col] = bool(np.allclose(
+            merged[f"{col}_full"].to_numpy(dtype='float64'),
+            merged[f"{col}_stored"].to_numpy(dtype='float64'),
+            rtol=rtol, atol=atol, equal_nan=True
+        ))
+    
+    if all(result.values()):
+        print(f"✅ Инкрементальный результат совпадает с полным пересчетом ({len(merged)} строк)")
+    else:
+        bad = [col for col, ok in result.items() if not ok]
+        print(f"⚠️ Расхождение с полным пересчетом: {', '.join(bad)}")
+    
+    return result
 
 
 # Пример использования
@@ -188,16 +788,20 @@ if __name__ == "__main__":
     use_cluster = '--cluster' in sys.argv
     scheduler = 'localhost:8786' if use_cluster else None
     
+    # Без кластера: --mode=pandas|processes|local, по умолчанию - автовыбор
+    mode = next((arg.split('=', 1)[1] for arg in sys.argv if arg.startswith('--mode=')), 'auto')
+    
     if use_cluster:
         print("🚀 Запуск с Dask кластером")
     else:
-        print("🐼 Запуск с локальным Pandas")
+        print(f"🐼 Запуск без кластера (режим: {mode})")
     
     # Создаем процессор
     processor = MOEXDataProcessor(
-        'data/moex_raw_data.csv',
+        'data/moex_raw',
         use_dask_cluster=use_cluster,
-        scheduler_address=scheduler
+        scheduler_address=scheduler,
+        mode=mode
     )
     
     # Обработка
@@ -210,15 +814,12 @@ if __name__ == "__main__":
     for key, value in stats.items():
         print(f"  {key}: {value}")
     
-    # Сохранение
+    # Сохранение дневных данных и агрегатов по неделям, месяцам и кварталам
     processor.save_results(
-        daily_output='data/moex_processed_daily.csv'
+        daily_output='data/moex_processed_daily',
+        rollup_outputs=ROLLUP_OUTPUTS
     )
     
-    # Агрегация
-    weekly_df = processor.aggregate_weekly()
-    weekly_df.to_csv('data/moex_processed_weekly.csv', index=False)
-    
     print("\n✅ Обработка завершена!")
     
     # Закрываем соединение
@@ -1,18 +1,181 @@
 import requests
 import pandas as pd
+import numpy as np
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from requests.adapters import HTTPAdapter
+import asyncio
+import os
+import random
+import sys
+import threading
 import time
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flows.iss_cache import UniverseCache
+from storage.checkpoint import ExtractCheckpoint
+from storage.raw_store import RawDataStore
+
+
+class TokenBucket:
+    """
+    Потокобезопасный token bucket с адаптивной скоростью
+
+    Общий для всех запросов коллектора: заменяет фиксированные паузы
+    между страницами и тикерами. После ответа 429 скорость снижается
+    вдвое, после успешных ответов плавно возвращается к исходной.
+    """
+
+    def __init__(self, rate, capacity=None, min_rate=0.5):
+        self.max_rate = float(rate)
+        self.rate = float(rate)
+        self.min_rate = min(float(min_rate), self.max_rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Дождаться свободного токена"""
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def slow_down(self):
+        """Снизить скорость после ответа 429"""
+        with self.lock:
+            self._refill()
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def speed_up(self):
+        """Постепенно вернуть скорость после успешного ответа"""
+        with self.lock:
+            self._refill()
+            self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+def _run_async(coro):
+    """Выполнить корутину и из обычного кода, и из работающего event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+
 class MOEXDataCollector:
     """Класс для сбора данных с Московской биржи"""
     
     BASE_URL = "https://iss.moex.com/iss"
+    PAGE_SIZE = 100
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
     
-    def __init__(self):
+    def __init__(self, max_concurrency=8, requests_per_second=10, max_retries=5,
+                 backoff_base=0.5, backoff_cap=30, timeout=30, cache=None,
+                 strategy='auto', board_size=300, universe_cache=None):
+        """
+        max_concurrency: максимум одновременных запросов к ISS (1 - последовательный режим)
+        requests_per_second: общий лимит запросов в секунду
+        max_retries: число повторов при 429/5xx и сетевых ошибках
+        backoff_base, backoff_cap: параметры экспоненциальной паузы с jitter (сек)
+        timeout: таймаут одного запроса (сек)
+        cache: кэш ответов (ResponseCache) или None
+        strategy: 'ticker' - история по каждой бумаге, 'date' - снимки всего
+                  режима TQBR по дням, 'auto' - выбор по оценке числа запросов
+        board_size: ожидаемое число бумаг в режиме TQBR (для оценки стратегии)
+        universe_cache: кэш рейтингов ликвидности (UniverseCache) или None
+        """
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_concurrency, pool_maxsize=max_concurrency)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.rate_limiter = TokenBucket(requests_per_second)
+        self.cache = cache
+        self.strategy = strategy
+        self.board_size = board_size
+        self.universe_cache = universe_cache
+        
+        self.request_count = 0
+        self.retry_count = 0
+        self._stats_lock = threading.Lock()
     
-    def get_history(self, secid, start_date, end_date):
-        """Получить историю торгов для конкретной акции"""
+    def _backoff(self, attempt, retry_after=None):
+        """Пауза перед повтором: full jitter, но не меньше Retry-After"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+    
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            return None
+    
+    def _request(self, url, params=None, kind=None):
+        """
+        GET-запрос к ISS с лимитом скорости и повторами на 429/5xx
+        
+        kind: тип запроса для выбора времени жизни записи в кэше
+        """
+        if self.cache is not None:
+            payload = self.cache.get(url, params)
+            if payload is not None:
+                return payload
+        
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            with self._stats_lock:
+                self.request_count += 1
+            
+            retry_after = None
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in self.RETRY_STATUSES:
+                    response.raise_for_status()
+                    self.rate_limiter.speed_up()
+                    payload = response.json()
+                    if self.cache is not None:
+                        self.cache.set(url, params, payload, kind)
+                    return payload
+                
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+                
+                if response.status_code == 429:
+                    self.rate_limiter.slow_down()
+                retry_after = self._retry_after(response)
+            
+            with self._stats_lock:
+                self.retry_count += 1
+            time.sleep(self._backoff(attempt, retry_after))
+    
+    def _history_request(self, secid, start_date, end_date):
         url = f"{self.BASE_URL}/history/engines/stock/markets/shares/boards/TQBR/securities/{secid}.json"
         
         params = {
@@ -21,27 +184,69 @@ class MOEXDataCollector:
             'start': 0
         }
         
-        all_data = []
+        return url, params
+    
+    @staticmethod
+    def _history_kind(end_date):
+        """Закрытые торговые дни не меняются - их можно кэшировать надолго"""
+        if pd.Timestamp(end_date).date() < datetime.now().date():
+            return 'history_closed'
+        return 'history_open'
+    
+    def _iter_pages(self, url, params, kind):
+        """Страницы блока history по одной: (смещение, DataFrame)"""
+        params = dict(params)
         
         while True:
-            response = self.session.get(url, params=params)
-            data = response.json()
+            data = self._request(url, dict(params), kind)
             
             history = data['history']
             columns = history['columns']
             rows = history['data']
             
             if not rows:
-                break
+                return
             
-            df_chunk = pd.DataFrame(rows, columns=columns)
-            all_data.append(df_chunk)
+            yield params['start'], pd.DataFrame(rows, columns=columns)
             
-            if len(rows) < 100:
-                break
+            if len(rows) < self.PAGE_SIZE:
+                return
             
-            params['start'] += 100
-            time.sleep(0.3)
+            params['start'] += self.PAGE_SIZE
+    
+    def _fetch_pages(self, url, params, kind):
+        """Прочитать все страницы блока history (по PAGE_SIZE строк)"""
+        return [df_chunk for _, df_chunk in self._iter_pages(url, params, kind)]
+    
+    def iter_history(self, secid, start_date, end_date, start_offset=0):
+        """
+        Генератор страниц истории бумаги: (смещение, DataFrame)
+        
+        Страницы не накапливаются в памяти; start_offset позволяет
+        продолжить загрузку с места остановки.
+        """
+        url, params = self._history_request(secid, start_date, end_date)
+        params['start'] = start_offset
+        
+        for offset, df_chunk in self._iter_pages(url, params, self._history_kind(end_date)):
+            df_chunk['SECID'] = secid
+            yield offset, df_chunk
+    
+    def iter_board_history(self, date, secids=None, start_offset=0):
+        """Генератор страниц снимка режима TQBR за день, отфильтрованных по secids"""
+        url = f"{self.BASE_URL}/history/engines/stock/markets/shares/boards/TQBR/securities.json"
+        params = {'date': date, 'start': start_offset}
+        wanted = set(secids) if secids is not None else None
+        
+        for offset, df_chunk in self._iter_pages(url, params, self._history_kind(date)):
+            if wanted is not None:
+                df_chunk = df_chunk[df_chunk['SECID'].isin(wanted)]
+            yield offset, df_chunk
+    
+    def get_history(self, secid, start_date, end_date):
+        """Получить историю торгов для конкретной акции"""
+        url, params = self._history_request(secid, start_date, end_date)
+        all_data = self._fetch_pages(url, params, self._history_kind(end_date))
         
         if all_data:
             result = pd.concat(all_data, ignore_index=True)
@@ -50,61 +255,326 @@ class MOEXDataCollector:
         
         return pd.DataFrame()
     
-    def collect_multiple_securities(self, secids, start_date, end_date):
-        """Собрать данные по нескольким акциям"""
-        all_data = []
+    def get_board_history(self, date, board='TQBR'):
+        """Получить итоги торгов всех акций режима торгов за один день"""
+        url = f"{self.BASE_URL}/history/engines/stock/markets/shares/boards/{board}/securities.json"
+        params = {'date': date, 'start': 0}
         
-        for secid in secids:
-            print(f"Загрузка данных для {secid}...")
-            df = self.get_history(secid, start_date, end_date)
-            
-            if not df.empty:
-                all_data.append(df)
-            
-            time.sleep(0.5)
+        all_data = self._fetch_pages(url, params, self._history_kind(date))
+        
+        if all_data:
+            return pd.concat(all_data, ignore_index=True)
+        
+        return pd.DataFrame()
+    
+    async def _map_async(self, func, args_list):
+        loop = asyncio.get_running_loop()
+        # Размер пула потоков ограничивает число запросов "в полете"
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            return await asyncio.gather(*[
+                loop.run_in_executor(executor, func, *args)
+                for args in args_list
+            ])
+    
+    def _map(self, func, args_list):
+        """Выполнить func для каждого набора аргументов, параллельно при max_concurrency > 1"""
+        if self.max_concurrency > 1 and len(args_list) > 1:
+            return _run_async(self._map_async(func, args_list))
+        
+        return [func(*args) for args in args_list]
+    
+    def estimate_requests(self, n_secids, start_date, end_date):
+        """
+        Оценка числа запросов для двух стратегий загрузки
+        
+        Возвращает (по тикерам, по датам). По тикерам - страницы истории
+        каждой бумаги, по датам - по одному запросу на неторговый день
+        и страницы снимка всего режима на каждый торговый день.
+        """
+        days = (pd.Timestamp(end_date) - pd.Timestamp(start_date)).days + 1
+        trading_days = max(1, round(days * 5 / 7))
+        
+        by_ticker = n_secids * (trading_days // self.PAGE_SIZE + 1)
+        by_date = (days - trading_days) + trading_days * (self.board_size // self.PAGE_SIZE + 1)
+        
+        return by_ticker, by_date
+    
+    def choose_strategy(self, n_secids, start_date, end_date):
+        """'ticker' или 'date' - в зависимости от размера выборки и периода"""
+        if self.strategy != 'auto':
+            return self.strategy
+        
+        by_ticker, by_date = self.estimate_requests(n_secids, start_date, end_date)
+        return 'date' if by_date < by_ticker else 'ticker'
+    
+    def _collect_by_ticker(self, secids, start_date, end_date):
+        print(f"Загрузка данных для {len(secids)} акций по тикерам "
+              f"(параллельно до {self.max_concurrency} запросов)...")
+        
+        return self._map(self.get_history, [(secid, start_date, end_date) for secid in secids])
+    
+    def _collect_by_date(self, secids, start_date, end_date):
+        dates = pd.date_range(start_date, end_date, freq='D').strftime('%Y-%m-%d')
+        print(f"Загрузка данных для {len(secids)} акций по датам: {len(dates)} дней "
+              f"(параллельно до {self.max_concurrency} запросов)...")
+        
+        days = self._map(self.get_board_history, [(date,) for date in dates])
+        
+        wanted = set(secids)
+        all_data = [df[df['SECID'].isin(wanted)] for df in days if not df.empty]
+        if not all_data:
+            return []
+        
+        # Тот же порядок строк, что и при загрузке по тикерам
+        df = pd.concat(all_data, ignore_index=True)
+        order = df['SECID'].map({secid: i for i, secid in enumerate(secids)})
+        df = df.iloc[np.lexsort((df['TRADEDATE'].to_numpy(), order.to_numpy()))]
+        
+        return [part.reset_index(drop=True) for _, part in df.groupby('SECID', sort=False)]
+    
+    @staticmethod
+    def _group_ranges(ranges):
+        """Бумаги с одинаковым периодом загружаются вместе: {(start, end): [secid, ...]}"""
+        groups = {}
+        for secid, start_date, end_date in ranges:
+            groups.setdefault((start_date, end_date), []).append(secid)
+        return groups
+    
+    def plan_strategies(self, ranges):
+        """
+        Стратегия загрузки каждой группы бумаг с общим периодом
+        
+        Возвращает [(стратегия, диапазоны группы)]. Стратегия выбирается по
+        размеру всей группы: план, который потом делится на части, должен
+        загружаться так же, как целиком.
+        """
+        return [
+            (self.choose_strategy(len(secids), start_date, end_date),
+             [(secid, start_date, end_date) for secid in secids])
+            for (start_date, end_date), secids in self._group_ranges(ranges).items()
+        ]
+    
+    def _collect(self, ranges):
+        """Загрузить историю по списку (secid, start_date, end_date)"""
+        # Стратегия выбирается для каждой группы бумаг с общим периодом
+        frames = []
+        for (start_date, end_date), secids in self._group_ranges(ranges).items():
+            if self.choose_strategy(len(secids), start_date, end_date) == 'date':
+                frames.extend(self._collect_by_date(secids, start_date, end_date))
+            else:
+                frames.extend(self._collect_by_ticker(secids, start_date, end_date))
+        
+        all_data = [df for df in frames if not df.empty]
         
         if all_data:
             return pd.concat(all_data, ignore_index=True)
         
         return pd.DataFrame()
     
-    def get_top_securities(self, limit=30):
+    def collect_multiple_securities(self, secids, start_date, end_date):
+        """
+        Собрать данные по нескольким акциям
+        
+        Стратегия (по тикерам или по датам) выбирается автоматически, при
+        max_concurrency > 1 запросы выполняются параллельно (asyncio).
+        Порядок строк в результате совпадает с порядком secids.
+        """
+        return self._collect([(secid, start_date, end_date) for secid in secids])
+    
+    @staticmethod
+    def incremental_ranges(secids, watermarks, end_date, backfill_days=365):
+        """
+        Диапазоны загрузки от watermark + 1 день до end_date
+        
+        Бумаги без watermark (новые тикеры) догружаются на backfill_days назад,
+        бумаги, по которым данные уже актуальны, пропускаются.
+        """
+        end = pd.Timestamp(end_date).normalize()
+        backfill_start = end - pd.Timedelta(days=backfill_days)
+        
+        ranges = []
+        for secid in secids:
+            watermark = watermarks.get(secid)
+            if watermark is None or pd.isna(watermark):
+                start = backfill_start
+            else:
+                start = pd.Timestamp(watermark).normalize() + pd.Timedelta(days=1)
+            
+            if start <= end:
+                ranges.append((secid, start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')))
+        
+        return ranges
+    
+    def _stream_series(self, key, make_pages, store, checkpoint):
+        """Записать страницы одной серии в store, отмечая прогресс в checkpoint"""
+        rows = 0
+        
+        for offset, df_chunk in make_pages(checkpoint.offset(key)):
+            store.write_page(df_chunk, f"{key}-{offset}")
+            rows += len(df_chunk)
+            checkpoint.advance(key, offset + self.PAGE_SIZE)
+        
+        checkpoint.finish(key)
+        return rows
+    
+    def stream_to_store(self, ranges, store, checkpoint, strategy=None):
+        """
+        Потоковая загрузка: каждая страница сразу пишется в store
+        
+        В памяти одновременно находится не больше max_concurrency страниц.
+        Серии, завершенные по checkpoint, пропускаются, незавершенные
+        продолжаются с сохраненного смещения. Возвращает число строк.
+        strategy: стратегия, уже выбранная для всего плана (см. plan_strategies);
+                  None - выбирается для каждой группы ranges
+        """
+        jobs = []
+        
+        for (start_date, end_date), secids in self._group_ranges(ranges).items():
+            if (strategy or self.choose_strategy(len(secids), start_date, end_date)) == 'date':
+                for date in pd.date_range(start_date, end_date, freq='D').strftime('%Y-%m-%d'):
+                    make_pages = partial(self.iter_board_history, date, secids)
+                    # Группы бумаг не пересекаются: первая бумага отличает
+                    # снимки одного дня для разных групп
+                    jobs.append((f"date_{date}_{secids[0]}", make_pages))
+            else:
+                for secid in secids:
+                    make_pages = partial(self.iter_history, secid, start_date, end_date)
+                    jobs.append((f"{secid}_{start_date}_{end_date}", make_pages))
+        
+        pending = [(key, make_pages, store, checkpoint)
+                   for key, make_pages in jobs if not checkpoint.is_done(key)]
+        print(f"Потоковая загрузка: {len(pending)} из {len(jobs)} серий страниц "
+              f"(параллельно до {self.max_concurrency} запросов)...")
+        
+        return sum(self._map(self._stream_series, pending))
+    
+    def plan_incremental(self, secids, store, end_date, backfill_days=365, checkpoint=None):
         """
-        Получить список топовых акций по капитализации и объему торгов
+        План инкрементальной загрузки: диапазоны (secid, start_date, end_date)
+        
+        Если в checkpoint есть незавершенный план на тот же end_date,
+        возвращается он, иначе план строится по watermark'ам store
+        и сохраняется в checkpoint.
         """
-        url = f"{self.BASE_URL}/engines/stock/markets/shares/boards/TQBR/securities.json"
+        checkpoint = checkpoint or ExtractCheckpoint(None)
+        plan = checkpoint.plan
         
-        response = self.session.get(url)
-        data = response.json()
+        if plan and plan['end_date'] == end_date:
+            ranges = [tuple(r) for r in plan['ranges']]
+            print(f"Продолжение прерванной загрузки: {len(ranges)} акций")
+        else:
+            watermarks = store.watermarks()
+            ranges = self.incremental_ranges(secids, watermarks, end_date, backfill_days)
+            checkpoint.start({'end_date': end_date, 'ranges': ranges})
+            
+            backfill = sum(1 for secid, _, _ in ranges if secid not in watermarks)
+            print(f"Инкрементальная загрузка: {len(ranges)} из {len(secids)} акций "
+                  f"(новых тикеров для backfill: {backfill})")
+        
+        return ranges
+    
+    def collect_incremental(self, secids, store, end_date, backfill_days=365, checkpoint=None):
+        """
+        Догрузить в store только новые торговые дни по каждой бумаге
+        
+        store: хранилище с методами watermarks(), write_page() и finalize() (RawDataStore)
+        checkpoint: ExtractCheckpoint; если в нем есть незавершенный план на
+                    тот же end_date, загрузка продолжается с места остановки
+        Возвращает число загруженных строк.
+        """
+        checkpoint = checkpoint or ExtractCheckpoint(None)
+        ranges = self.plan_incremental(secids, store, end_date, backfill_days, checkpoint)
+        
+        rows = self.stream_to_store(ranges, store, checkpoint) if ranges else 0
+        partitions = store.finalize()
+        checkpoint.clear()
+        
+        print(f"Добавлено/обновлено строк: {rows} (партиций: {partitions})")
+        return rows
+    
+    def _rank_by_market_data(self, board):
+        """Рейтинг по обороту текущей сессии (VALTODAY из блока marketdata)"""
+        url = f"{self.BASE_URL}/engines/stock/markets/shares/boards/{board}/securities.json"
+        
+        data = self._request(url, kind='securities')
         
         securities = data['securities']
-        columns = securities['columns']
-        rows = securities['data']
+        df = pd.DataFrame(securities['data'], columns=securities['columns'])
         
-        df = pd.DataFrame(rows, columns=columns)
-                
         # Фильтруем только активные акции
         df = df[df['SECID'].notna()]
+        if 'STATUS' in df.columns:
+            df = df[df['STATUS'] == 'A']
+        
+        marketdata = data.get('marketdata')
+        if not marketdata:
+            return []
         
-        # Если есть колонка с капитализацией или ценой, сортируем по ней
-        if 'PREVPRICE' in df.columns:
-            # Убираем строки без цены
-            df = df[df['PREVPRICE'].notna() & (df['PREVPRICE'] > 0)]
-            # Сортируем по цене (как прокси для популярности)
-            df = df.sort_values('PREVPRICE', ascending=False)
+        md = pd.DataFrame(marketdata['data'], columns=marketdata['columns'])
+        if 'VALTODAY' not in md.columns:
+            return []
+        
+        md = md[md['SECID'].isin(df['SECID']) & (md['VALTODAY'] > 0)]
+        return md.sort_values('VALTODAY', ascending=False)['SECID'].tolist()
+    
+    def _rank_by_history(self, board, days):
+        """Рейтинг по среднему дневному обороту (VALUE) за последние days торговых дней"""
+        today = pd.Timestamp(datetime.now().date())
+        # Календарных дней берем с запасом на выходные и праздники
+        dates = pd.date_range(end=today - pd.Timedelta(days=1), periods=days * 2 + 5, freq='D')
+        
+        frames = self._map(self.get_board_history, [(date.strftime('%Y-%m-%d'), board) for date in dates])
+        frames = [df for df in frames if not df.empty][-days:]
+        if not frames:
+            return []
+        
+        df = pd.concat(frames, ignore_index=True)
+        # Дни без торгов бумагой считаются днями с нулевым оборотом
+        turnover = df.groupby('SECID')['VALUE'].sum() / len(frames)
+        turnover = turnover[turnover > 0]
+        return turnover.sort_values(ascending=False).index.tolist()
+    
+    def rank_by_liquidity(self, board='TQBR', days=None):
+        """
+        Все бумаги режима торгов, упорядоченные по ликвидности
+        
+        days: None - оборот текущей сессии, N - средний оборот за N последних
+        торговых дней. Если текущая сессия еще не началась (оборот нулевой),
+        используется история за 5 дней.
+        """
+        ranking = self._rank_by_history(board, days) if days else self._rank_by_market_data(board)
+        
+        if not ranking and not days:
+            ranking = self._rank_by_history(board, 5)
+        
+        return ranking
+    
+    def get_top_securities(self, limit=30, board='TQBR', days=None):
+        """
+        Получить список топовых акций по объему торгов (обороту в рублях)
+        
+        Рейтинг целиком кэшируется в universe_cache по ключу (board, days),
+        поэтому топ-N для любого N берется из кэша без запросов к ISS.
+        """
+        key = f"{board}:{days or 0}"
+        ranking = self.universe_cache.get(key) if self.universe_cache is not None else None
+        
+        if ranking is None:
+            ranking = self.rank_by_liquidity(board, days)
+            if ranking and self.universe_cache is not None:
+                self.universe_cache.set(key, ranking)
         
         # Берем первые N акций
-        result = df.head(limit)['SECID'].tolist()
+        result = ranking[:limit]
         
         # Если результат пустой, возвращаем None
         return result if result else None
 
-
 if __name__ == "__main__":
-    collector = MOEXDataCollector()
+    collector = MOEXDataCollector(universe_cache=UniverseCache('data/.universe_cache.json'))
     
-    # РАСШИРЕННЫЙ СПИСОК - топ-30 акций
-    print("Получение списка топ-30 акций...")
+    # РАСШИРЕННЫЙ СПИСОК - самые ликвидные акции
+    print("Получение списка самых ликвидных акций...")
     securities = collector.get_top_securities(limit=50)
     
     # Если API не работает, используем фиксированный список
@@ -126,5 +596,5 @@ if __name__ == "__main__":
     print(f"Сбор данных с {start_date} по {end_date}...")
     df = collector.collect_multiple_securities(securities, start_date, end_date)
     
-    df.to_csv('data/moex_raw_data.csv', index=False)
+    RawDataStore('data/moex_raw').upsert(df)
     print(f"Данные сохранены: {len(df)} записей по {df['SECID'].nunique()} акциям")
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class CacheMissError(LookupError):
+    """Ответа нет в кэше, а обращение к сети запрещено (режим replay)"""
+
+
+class ResponseCache:
+    """
+    Дисковый кэш ответов ISS API
+    
+    Ключ - URL плюс параметры запроса. Время жизни записи зависит от типа
+    запроса: история по закрытым торговым дням не меняется и хранится долго,
+    текущий день и списки бумаг - недолго. При превышении max_size_mb
+    удаляются записи, к которым дольше всего не обращались.
+    
+    В режиме replay_only кэш отдает записанные ответы независимо от срока
+    жизни и никогда не пропускает запрос в сеть.
+    """
+    
+    DEFAULT_TTLS = {
+        'history_closed': 365 * 24 * 3600,  # закрытые торговые дни
+        'history_open': 15 * 60,            # период включает сегодняшний день
+        'securities': 60 * 60,              # списки бумаг и marketdata
+    }
+    DEFAULT_TTL = 15 * 60
+    
+    def __init__(self, directory='data/.iss_cache', max_size_mb=512, replay_only=False, ttls=None):
+        """
+        directory: папка для файлов кэша
+        max_size_mb: максимальный суммарный размер кэша
+        replay_only: работать только с записанными ответами, без сети
+        ttls: переопределение времени жизни по типам запросов (сек)
+        """
+        self.directory = directory
+        self.max_size = int(max_size_mb * 1024**2)
+        self.replay_only = replay_only
+        self.ttls = dict(self.DEFAULT_TTLS, **(ttls or {}))
+        
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+    
+    @staticmethod
+    def make_key(url, params=None):
+        raw = json.dumps([url, sorted((params or {}).items())], default=str)
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json")
+    
+    def _entries(self):
+        """(mtime, size, path) для всех файлов кэша"""
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if not name.endswith('.json'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+    
+    def get(self, url, params=None):
+        """Сохраненный ответ или None (в режиме replay - CacheMissError)"""
+        path = self._path(self.make_key(url, params))
+        
+        try:
+            with open(path, encoding='utf-8') as f:
+                entry = json.load(f)
+        except (FileNotFoundError, ValueError):
+            entry = None
+        
+        if entry is not None and (self.replay_only or entry['expires_at'] > time.time()):
+            try:
+                os.utime(path)  # отметка для вытеснения давно не используемых записей
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                self.hits += 1
+            return entry['payload']
+        
+        with self._lock:
+            self.misses += 1
+        
+        if self.replay_only:
+            raise CacheMissError(f"Нет записанного ответа ISS: {url} {params or {}}")
+        
+        return None
+    
+    def set(self, url, params, payload, kind=None):
+        """Сохранить ответ с временем жизни по типу запроса kind"""
+        if self.replay_only:
+            return
+        
+        ttl = self.ttls.get(kind, self.DEFAULT_TTL)
+        if ttl <= 0:
+            return
+        
+        now = time.time()
+        entry = {
+            'url': url,
+            'params': params or {},
+            'kind': kind,
+            'stored_at': now,
+            'expires_at': now + ttl,
+            'payload': payload,
+        }
+        data = json.dumps(entry, ensure_ascii=False, default=str).encode('utf-8')
+        
+        path = self._path(self.make_key(url, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        
+        with self._lock:
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            
+            self._size += len(data) - old_size
+            if self._size > self.max_size:
+                self._evict()
+    
+    def _evict(self):
+        """Удалить самые старые записи, пока кэш не станет меньше 90% лимита"""
+        target = self.max_size * 0.9
+        
+        for _, size, path in sorted(self._entries()):
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self._size -= size
+    
+    def clear(self):
+        """Удалить все записи"""
+        with self._lock:
+            for _, _, path in list(self._entries()):
+                os.remove(path)
+            self._size = 0
+
+
+class UniverseCache:
+    """
+    Кэш рейтингов ликвидности бумаг
+    
+    Хранит полный упорядоченный список SECID по ключу (режим торгов,
+    глубина усреднения), поэтому запрос "топ-N" для любого N не требует
+    обращения к ISS, пока запись не устарела.
+    """
+    
+    def __init__(self, path='data/.universe_cache.json', ttl=6 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+    
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+    
+    def get(self, key):
+        """Сохраненный рейтинг или None, если его нет или он устарел"""
+        entry = self._load().get(key)
+        if entry is None or entry['stored_at'] + self.ttl <= time.time():
+            return None
+        return entry['ranking']
+    
+    def set(self, key, ranking):
+        with self._lock:
+            entries = self._load()
+            entries[key] = {'stored_at': time.time(), 'ranking': list(ranking)}
+            
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
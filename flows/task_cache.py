@@ -0,0 +1,213 @@
+import functools
+import hashlib
+import importlib
+import json
+import os
+import sys
+import uuid
+from datetime import timedelta
+
+from prefect.filesystems import LocalFileSystem
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dask_jobs.indicators import DEFAULT_INDICATORS, output_columns
+from dask_jobs.transform import ROLLUP_OUTPUTS
+from storage.indicator_state import IndicatorState
+from storage.parquet_store import ParquetStore
+
+# Результаты задач пайплайна (pickle) - локально, рядом с данными
+RESULTS_PATH = 'data/.prefect_results'
+RESULT_STORAGE = LocalFileSystem(basepath=RESULTS_PATH)
+CACHE_EXPIRATION = timedelta(days=7)
+
+# Модули, от которых зависят результаты задач: их исходный код входит в ключи
+CODE_MODULES = [
+    'dask_jobs.indicators', 'dask_jobs.rollup', 'dask_jobs.transform',
+    'flows.extract_moex', 'storage.parquet_store', 'storage.raw_store'
+]
+
+
+@functools.lru_cache(maxsize=None)
+def code_version(modules=tuple(CODE_MODULES)):
+    """Хэш исходного кода модулей: при изменении кода ключи кэша меняются"""
+    digest = hashlib.sha256()
+    for name in modules:
+        with open(importlib.import_module(name).__file__, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def results_generation(path=RESULTS_PATH):
+    """
+    Идентификатор папки сохраненных результатов (создается вместе с ней)
+    
+    Ключи кэша хранятся в БД Prefect, а результаты - в папке: после ее
+    удаления идентификатор меняется, и старые ключи больше не совпадают.
+    """
+    marker = os.path.join(path, '.generation')
+    if not os.path.exists(marker):
+        os.makedirs(path, exist_ok=True)
+        with open(marker, 'w', encoding='utf-8') as f:
+            f.write(uuid.uuid4().hex)
+    with open(marker, encoding='utf-8') as f:
+        return f.read().strip()
+
+
+def cache_key(stage, *parts):
+    """
+    Ключ кэша этапа: хэш имени этапа, версии кода и входов
+    
+    Одинаковые входы дают одинаковый ключ, и Prefect возвращает
+    сохраненный результат вместо запуска задачи.
+    """
+    payload = json.dumps([stage, results_generation(), code_version(), *parts],
+                         default=str, sort_keys=True)
+    return f"{stage}-{hashlib.sha256(payload.encode('utf-8')).hexdigest()}"
+
+
+def file_fingerprint(path):
+    """Отпечаток файла по размеру и времени изменения (None - файла нет)"""
+    if not os.path.exists(path):
+        return None
+    stat = os.stat(path)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def input_fingerprint(path):
+    """Отпечаток входных данных: Parquet-датасета (папки) или файла CSV"""
+    if os.path.isdir(path):
+        return ParquetStore(path).fingerprint()
+    return file_fingerprint(path)
+
+
+def indicator_set(parameters):
+    """Набор индикаторов задачи и их выходные колонки"""
+    names = parameters.get('indicators')
+    names = DEFAULT_INDICATORS if names is None else list(names)
+    return [names, output_columns(names)]
+
+
+def watermarks(state, secids=None):
+    """watermark'и состояния индикаторов для ключа (None - полный пересчет)"""
+    if state is None:
+        return None
+    wanted = None if secids is None else {str(secid) for secid in secids}
+    return sorted(
+        (str(secid), str(date)) for secid, date in state.watermarks.items()
+        if wanted is None or str(secid) in wanted
+    )
+
+
+def output_versions(daily_output):
+    """
+    Текущие версии дневного датасета и датасетов агрегатов
+    
+    Версия - из манифеста (меняется при каждой записи датасета), None -
+    датасета нет.
+    """
+    paths = [daily_output] + list(ROLLUP_OUTPUTS.values())
+    versions = {}
+    for path in paths:
+        manifest = ParquetStore(path).manifest()
+        versions[os.path.abspath(path)] = manifest['version'] if manifest else None
+    return versions
+
+
+def outputs_exist(daily_output):
+    """Есть ли дневной датасет и все датасеты агрегатов"""
+    return all(ParquetStore(path).exists() for path in [daily_output, *ROLLUP_OUTPUTS.values()])
+
+
+def task_result(daily_output, state):
+    """
+    Результат задачи обработки для кэша: путь дневного датасета, версии
+    записанных ею датасетов и watermark'и сохраненного ею состояния
+    """
+    return {
+        'daily_output': daily_output,
+        'versions': output_versions(daily_output),
+        'watermarks': watermarks(state),
+    }
+
+
+def is_current(result, state):
+    """
+    Актуален ли результат задачи обработки (в том числе взятый из кэша)
+    
+    Да, если датасеты и состояние индикаторов остались такими, какими их
+    оставила задача: с тех пор их не перезаписывали и не удаляли.
+    """
+    if not isinstance(result, dict):
+        return False
+    return (
+        all(result['versions'].values())
+        and result['versions'] == output_versions(result['daily_output'])
+        and result['watermarks'] == watermarks(state)
+    )
+
+
+def transform_shard_key(context, parameters):
+    """
+    Обработка части: сырые файлы ее бумаг, индикаторы и их состояние
+    
+    Изменение данных одной бумаги меняет ключ только ее части.
+    """
+    secids = parameters['secids']
+    return cache_key(
+        'transform_shard',
+        os.path.abspath(parameters['raw_file']),
+        sorted(secids),
+        indicator_set(parameters),
+        ParquetStore(parameters['raw_file']).fingerprint(secids),
+        watermarks(parameters['state'], secids)
+    )
+
+
+def merge_shards_key(context, parameters):
+    """
+    Сборка частей: все сырые данные, индикаторы и режим сборки
+    
+    В ключе только входы и режим (инкрементально или полный пересчет):
+    принудительный полный пересчет не совпадает с прошлой инкрементальной
+    сборкой. Ни результаты, ни состояние индикаторов, которые сборка сама
+    переписывает, в него не входят: иначе после любого запуска ключ
+    следующего менялся бы. Сохраненный результат проверяется по версиям
+    результатов и состоянию (is_current).
+    """
+    return cache_key(
+        'merge_shards',
+        os.path.abspath(parameters['raw_file']),
+        os.path.abspath(parameters['daily_output']),
+        indicator_set(parameters),
+        parameters['incremental'],
+        parameters['full_recompute'],
+        parameters['verify'],
+        ParquetStore(parameters['raw_file']).fingerprint()
+    )
+
+
+def transform_key(context, parameters):
+    """
+    Обработка целиком: сырые данные, индикаторы и режим (см. merge_shards_key)
+    
+    Режим - флаг full_recompute и то, пойдет ли обработка инкрементально
+    (так же, как решает transform_task: по состоянию и наличию результатов).
+    """
+    names = indicator_set(parameters)[0]
+    incremental = (
+        not parameters['full_recompute']
+        and IndicatorState(parameters['state_path']).matches(names)
+        and outputs_exist(parameters['daily_output'])
+    )
+    return cache_key(
+        'transform',
+        os.path.abspath(parameters['input_file']),
+        os.path.abspath(parameters['daily_output']),
+        os.path.abspath(parameters['state_path']),
+        indicator_set(parameters),
+        parameters['full_recompute'],
+        incremental,
+        parameters['verify'],
+        input_fingerprint(parameters['input_file'])
+    )
@@ -0,0 +1,117 @@
+import json
+import os
+import threading
+
+
+class ExtractCheckpoint:
+    """
+    Точка возобновления потоковой загрузки
+    
+    Хранит план загрузки (список диапазонов) и для каждой серии страниц
+    (бумага или дата) смещение следующей страницы. После сбоя повторный
+    запуск продолжает с того же плана и тех же смещений.
+    Прогресс по страницам дописывается строками в журнал (path.journal),
+    а не переписывает весь файл на каждой странице; журнал сворачивается
+    в снимок (path) каждые COMPACT_EVERY записей и при смене плана.
+    path=None - состояние только в памяти.
+    """
+    
+    DONE = 'done'
+    COMPACT_EVERY = 1000
+    
+    def __init__(self, path='data/.extract_checkpoint.json'):
+        self.path = path
+        self.journal_path = f"{path}.journal" if path else None
+        self._lock = threading.Lock()
+        self._entries = 0
+        self.state = self._load()
+    
+    def _load(self):
+        state = {'plan': None, 'series': {}, 'generation': 0}
+        if self.path and os.path.exists(self.path):
+            with open(self.path, encoding='utf-8') as f:
+                state.update(json.load(f))
+        
+        if self.journal_path and os.path.exists(self.journal_path):
+            with open(self.journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        generation, key, value = json.loads(line)
+                    except ValueError:
+                        # Недописанная строка при сбое - последняя в журнале
+                        break
+                    # Записи до последнего снимка в нем уже учтены
+                    if generation == state['generation']:
+                        state['series'][key] = value
+                        self._entries += 1
+        return state
+    
+    def _save(self):
+        """Снимок состояния; журнал после него начинается заново"""
+        if not self.path:
+            return
+        
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        self.state['generation'] += 1
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._entries = 0
+    
+    def _record(self, key, value):
+        """Дописать изменение серии в журнал"""
+        self.state['series'][key] = value
+        if not self.path:
+            return
+        
+        if self._entries >= self.COMPACT_EVERY or not os.path.exists(self.path):
+            self._save()
+            return
+        
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps([self.state['generation'], key, value], ensure_ascii=False) + '\n')
+        self._entries += 1
+    
+    @property
+    def plan(self):
+        return self.state['plan']
+    
+    def start(self, plan):
+        """Начать новый план (прогресс по старому плану сбрасывается)"""
+        with self._lock:
+            if self.state['plan'] != plan:
+                self.state = {'plan': plan, 'series': {}, 'generation': self.state['generation']}
+                self._save()
+    
+    def offset(self, key):
+        """Смещение, с которого нужно продолжить серию"""
+        value = self.state['series'].get(key, 0)
+        return 0 if value == self.DONE else value
+    
+    def is_done(self, key):
+        return self.state['series'].get(key) == self.DONE
+    
+    def advance(self, key, offset):
+        """Отметить, что страницы серии до offset записаны"""
+        with self._lock:
+            self._record(key, offset)
+    
+    def finish(self, key):
+        with self._lock:
+            self._record(key, self.DONE)
+    
+    def clear(self):
+        """Удалить точку возобновления после успешной загрузки"""
+        with self._lock:
+            self.state = {'plan': None, 'series': {}, 'generation': 0}
+            self._entries = 0
+            for path in (self.path, self.journal_path):
+                if path and os.path.exists(path):
+                    os.remove(path)
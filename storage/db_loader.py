@@ -0,0 +1,370 @@
+import io
+import os
+import time
+
+import pyarrow as pa
+import pyarrow.csv as pacsv
+from sqlalchemy import create_engine
+
+from storage.parquet_store import ParquetStore
+
+
+# БД по умолчанию, если DATABASE_URL не задан (локальный запуск без Postgres)
+DEFAULT_DATABASE_URL = 'sqlite:///data/moex.db'
+
+# Отпечатки загруженных партиций: (таблица, SECID, год) -> отпечаток их Parquet-файлов
+LOAD_STATE_TABLE = 'moex_load_state'
+
+# Ключ всех таблиц: бумага и дата (для агрегатов - метка периода)
+KEY_COLUMNS = ['secid', 'tradedate']
+
+
+def database_url(url=None):
+    """Адрес БД: аргумент, переменная окружения DATABASE_URL или SQLite"""
+    return url or os.environ.get('DATABASE_URL') or DEFAULT_DATABASE_URL
+
+
+def sql_type(arrow_type, dialect):
+    """Тип колонки в БД по типу Arrow"""
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    if pa.types.is_timestamp(arrow_type) or pa.types.is_date(arrow_type):
+        return 'DATE'
+    if pa.types.is_integer(arrow_type):
+        return 'BIGINT'
+    if pa.types.is_floating(arrow_type):
+        return 'DOUBLE PRECISION' if dialect == 'postgresql' else 'REAL'
+    return 'TEXT'
+
+
+def prepare_batch(batch):
+    """
+    Пакет строк датасета для записи в БД
+    
+    Колонки - в нижнем регистре, TRADEDATE - дата без времени,
+    категории - обычный текст.
+    """
+    arrays = []
+    for array in batch.columns:
+        if pa.types.is_dictionary(array.type):
+            array = array.cast(array.type.value_type)
+        if pa.types.is_timestamp(array.type):
+            array = array.cast(pa.date32())
+        arrays.append(array)
+    return pa.table(arrays, names=[name.lower() for name in batch.schema.names])
+
+
+def chunks(batches, rows):
+    """
+    Пакеты строк, собранные в таблицы примерно по rows строк
+    
+    Файлы партиций агрегатов маленькие (десятки строк), поэтому пакеты
+    объединяются: одна запись в БД на много файлов.
+    """
+    pending, size = [], 0
+    for batch in batches:
+        if not batch.num_rows:
+            continue
+        pending.append(prepare_batch(batch))
+        size += batch.num_rows
+        if size >= rows:
+            yield pa.concat_tables(pending)
+            pending, size = [], 0
+    if pending:
+        yield pa.concat_tables(pending)
+
+
+def connect(url=None):
+    """
+    Загрузчик для БД по адресу url (по умолчанию - из DATABASE_URL)
+    
+    Postgres загружается через COPY, остальные БД (SQLite) - пакетными
+    вставками; интерфейс у загрузчиков один.
+    """
+    engine = create_engine(database_url(url))
+    if engine.dialect.name == 'postgresql':
+        return PostgresLoader(engine)
+    if engine.dialect.name == 'sqlite':
+        return SQLiteLoader(engine)
+    raise ValueError(f"Неподдерживаемая БД: {engine.dialect.name}")
+
+
+class DatabaseLoader:
+    """
+    Загрузка Parquet-датасетов в таблицы БД
+    
+    Строки партиций (бумага, год), чьи файлы изменились с прошлой загрузки
+    (по отпечаткам ParquetStore), потоком пакетов pyarrow пишутся во временную
+    таблицу, а затем одним запросом сливаются с целевой: INSERT ... ON CONFLICT
+    (secid, tradedate) DO UPDATE. Строки этих партиций, которых больше нет
+    в датасете, удаляются, поэтому таблица повторяет датасет. Ежедневное
+    обновление переписывает партицию текущего года, и загружается только она,
+    а не вся история бумаги. Все изменения
+    таблицы - в одной транзакции: читатели видят либо старые, либо новые данные.
+    """
+    
+    PARAM = '?'
+    # Окончание CREATE TABLE целевой таблицы (партиционирование)
+    TABLE_OPTIONS = ''
+    # Строк в одной записи во временную таблицу
+    COPY_ROWS = 250_000
+    
+    def __init__(self, engine):
+        self.engine = engine
+        self.dialect = engine.dialect.name
+    
+    def close(self):
+        self.engine.dispose()
+    
+    def load(self, tables):
+        """
+        Загрузить датасеты: {таблица: путь к датасету}
+        
+        Возвращает {таблица: число загруженных строк}.
+        """
+        return {table: self.load_table(table, path) for table, path in tables.items()}
+    
+    def load_table(self, table, path):
+        store = ParquetStore(path)
+        if not store.exists():
+            print(f"⚠️ {table}: датасет {path} пуст, загрузка пропущена")
+            return 0
+        
+        start = time.perf_counter()
+        # Одна версия датасета на всю загрузку
+        store = ParquetStore(store.data_dir)
+        partitions = store.partitions()
+        fingerprints = store.fingerprints()
+        
+        connection = self.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            self._create_load_state(cursor)
+            existing = self._existing_columns(cursor, table)
+            
+            # Без таблицы отпечатки прошлых загрузок не в счет
+            loaded = self._loaded(cursor, table) if existing else {}
+            changed = sorted(key for key, value in fingerprints.items() if loaded.get(key) != value)
+            removed = sorted(set(loaded) - set(fingerprints))
+            
+            rows = 0
+            if changed:
+                # Схема и партиции таблицы - только по файлам изменившихся партиций
+                files = [path for key in changed for path in partitions.get(key, [])]
+                schema = store.schema(files)
+                columns = store.columns(schema)
+                self._create_table(cursor, table, columns, schema, existing)
+                self._create_partitions(cursor, table, sorted({year for _, year in changed}))
+                
+                self._create_staging(cursor, table)
+                batches = store.dataset(schema=schema, files=files).to_batches(columns=columns)
+                for chunk in chunks(batches, self.COPY_ROWS):
+                    self._copy(cursor, f"{table}_stage", chunk)
+                    rows += chunk.num_rows
+                self._merge(cursor, table, [name.lower() for name in columns])
+                # В только что созданной таблице удалять нечего
+                if existing:
+                    self._delete_missing(cursor, table, changed)
+                cursor.execute(f"DROP TABLE {table}_stage")
+            if removed:
+                self._delete(cursor, table, removed)
+            self._save_loaded(cursor, table, {key: fingerprints[key] for key in changed}, removed)
+            
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            connection.close()
+        
+        print(f"💾 {table}: {rows} строк ({len(changed)} партиций (бумага, год) изменено, "
+              f"{len(removed)} удалено) за {time.perf_counter() - start:.2f} с")
+        return rows
+    
+    def _create_load_state(self, cursor):
+        existing = self._existing_columns(cursor, LOAD_STATE_TABLE)
+        if existing and 'year' not in existing:
+            # Состояние прошлых версий - по бумагам: один раз загружается все заново
+            cursor.execute(f"DROP TABLE {LOAD_STATE_TABLE}")
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {LOAD_STATE_TABLE} ("
+            "table_name TEXT NOT NULL, secid TEXT NOT NULL, year INTEGER NOT NULL, "
+            "fingerprint TEXT NOT NULL, PRIMARY KEY (table_name, secid, year))"
+        )
+    
+    def _loaded(self, cursor, table):
+        """Отпечатки загруженных партиций: {(SECID, год): отпечаток}"""
+        cursor.execute(
+            f"SELECT secid, year, fingerprint FROM {LOAD_STATE_TABLE} WHERE table_name = {self.PARAM}",
+            (table,)
+        )
+        return {(secid, year): value for secid, year, value in cursor.fetchall()}
+    
+    def _save_loaded(self, cursor, table, fingerprints, removed):
+        p = self.PARAM
+        cursor.executemany(
+            f"INSERT INTO {LOAD_STATE_TABLE} (table_name, secid, year, fingerprint) VALUES ({p}, {p}, {p}, {p}) "
+            "ON CONFLICT (table_name, secid, year) DO UPDATE SET fingerprint = EXCLUDED.fingerprint",
+            [(table, secid, year, value) for (secid, year), value in fingerprints.items()]
+        )
+        cursor.executemany(
+            f"DELETE FROM {LOAD_STATE_TABLE} WHERE table_name = {p} AND secid = {p} AND year = {p}",
+            [(table, secid, year) for secid, year in removed]
+        )
+    
+    def _existing_columns(self, cursor, table):
+        """Колонки таблицы в БД (пустой список - таблицы нет)"""
+        raise NotImplementedError
+    
+    def _create_table(self, cursor, table, columns, schema, existing):
+        """Создать таблицу или добавить в нее новые колонки датасета (existing - текущие)"""
+        definitions = {name.lower(): sql_type(schema.field(name).type, self.dialect) for name in columns}
+        
+        if not existing:
+            self._create_target(cursor, table, definitions)
+        else:
+            for name, column_type in definitions.items():
+                if name not in existing:
+                    cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {column_type}")
+    
+    def _create_target(self, cursor, table, definitions):
+        columns = ', '.join(
+            f"{name} {column_type}" + (' NOT NULL' if name in KEY_COLUMNS else '')
+            for name, column_type in definitions.items()
+        )
+        cursor.execute(
+            f"CREATE TABLE {table} ({columns}, PRIMARY KEY ({', '.join(KEY_COLUMNS)})){self.TABLE_OPTIONS}"
+        )
+    
+    def _create_partitions(self, cursor, table, years):
+        """Партиции таблицы по годам (если БД их поддерживает)"""
+    
+    def _create_staging(self, cursor, table):
+        raise NotImplementedError
+    
+    def _copy(self, cursor, staging, table):
+        """Записать пакет строк (pyarrow.Table) во временную таблицу"""
+        raise NotImplementedError
+    
+    def _partition_filters(self, partitions):
+        """
+        Условия на строки партиций (бумага, год): по одному на год
+        
+        Возвращает [(условие, параметры)]; условие по году - диапазон tradedate,
+        поэтому в Postgres запрос идет только по партиции этого года.
+        """
+        by_year = {}
+        for secid, year in partitions:
+            by_year.setdefault(year, []).append(secid)
+        
+        p = self.PARAM
+        return [
+            (f"tradedate >= {p} AND tradedate < {p} AND secid IN ({', '.join([p] * len(secids))})",
+             (f"{year}-01-01", f"{year + 1}-01-01", *secids))
+            for year, secids in sorted(by_year.items())
+        ]
+    
+    def _merge(self, cursor, table, names):
+        """Слить временную таблицу с целевой: upsert по (secid, tradedate)"""
+        columns = ', '.join(names)
+        updates = ', '.join(f"{name} = EXCLUDED.{name}" for name in names if name not in KEY_COLUMNS)
+        # WHERE TRUE - для SQLite: иначе ON CONFLICT читается как часть SELECT
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {table}_stage WHERE TRUE "
+            f"ON CONFLICT ({', '.join(KEY_COLUMNS)}) DO UPDATE SET {updates}"
+        )
+    
+    def _delete_missing(self, cursor, table, partitions):
+        """Удалить строки партиций (бумага, год), которых нет во временной таблице"""
+        for condition, params in self._partition_filters(partitions):
+            cursor.execute(
+                f"DELETE FROM {table} WHERE {condition} AND NOT EXISTS ("
+                f"SELECT 1 FROM {table}_stage s "
+                f"WHERE s.secid = {table}.secid AND s.tradedate = {table}.tradedate)",
+                params
+            )
+    
+    def _delete(self, cursor, table, partitions):
+        """Удалить строки партиций (бумага, год), которых больше нет в датасете"""
+        for condition, params in self._partition_filters(partitions):
+            cursor.execute(f"DELETE FROM {table} WHERE {condition}", params)
+
+
+class PostgresLoader(DatabaseLoader):
+    """
+    Загрузка в Postgres: COPY во временную таблицу и upsert в целевую
+    
+    Целевые таблицы партиционированы по диапазонам tradedate (партиция
+    на год). Первичный ключ (secid, tradedate) в каждой партиции - индекс,
+    который начинается с secid, поэтому запросы по бумагам идут по индексу.
+    """
+    
+    PARAM = '%s'
+    TABLE_OPTIONS = ' PARTITION BY RANGE (tradedate)'
+    
+    def _existing_columns(self, cursor, table):
+        cursor.execute(
+            "SELECT column_name FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s",
+            (table,)
+        )
+        return [row[0] for row in cursor.fetchall()]
+    
+    def _create_partitions(self, cursor, table, years):
+        for year in years:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {table}_{year} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{year}-01-01') TO ('{year + 1}-01-01')"
+            )
+    
+    def _create_staging(self, cursor, table):
+        # Временная таблица без индексов и WAL: COPY в нее - самая дешевая запись
+        cursor.execute(f"CREATE TEMPORARY TABLE {table}_stage (LIKE {table}) ON COMMIT DROP")
+    
+    def _copy(self, cursor, staging, table):
+        buffer = io.BytesIO()
+        pacsv.write_csv(table, buffer, write_options=pacsv.WriteOptions(include_header=False))
+        buffer.seek(0)
+        cursor.copy_expert(
+            f"COPY {staging} ({', '.join(table.column_names)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+
+
+class SQLiteLoader(DatabaseLoader):
+    """
+    Загрузка в SQLite (локальный запуск и проверки без Postgres)
+    
+    COPY нет, поэтому временная таблица заполняется пакетными вставками
+    (executemany); слияние и удаление - те же запросы, что и в Postgres.
+    Партиций нет, запросы по бумагам идут по первичному ключу.
+    """
+    
+    def __init__(self, engine):
+        super().__init__(engine)
+        database = engine.url.database
+        if database and database != ':memory:' and os.path.dirname(database):
+            os.makedirs(os.path.dirname(database), exist_ok=True)
+    
+    def _existing_columns(self, cursor, table):
+        cursor.execute(f"PRAGMA table_info({table})")
+        return [row[1] for row in cursor.fetchall()]
+    
+    def _create_staging(self, cursor, table):
+        cursor.execute(f"DROP TABLE IF EXISTS temp.{table}_stage")
+        cursor.execute(f"CREATE TEMPORARY TABLE {table}_stage AS SELECT * FROM {table} WHERE 0")
+        # Без индекса поиск строк в удалении исчезнувших строк - перебор временной таблицы
+        cursor.execute(f"CREATE INDEX temp.{table}_stage_key ON {table}_stage ({', '.join(KEY_COLUMNS)})")
+    
+    def _copy(self, cursor, staging, table):
+        # Даты - строками ISO, как их хранит SQLite
+        columns = [
+            column.cast(pa.string()) if pa.types.is_date(column.type) else column
+            for column in table.columns
+        ]
+        rows = zip(*(column.to_pylist() for column in columns))
+        placeholders = ', '.join(['?'] * len(columns))
+        cursor.executemany(
+            f"INSERT INTO {staging} ({', '.join(table.column_names)}) VALUES ({placeholders})",
+            rows
+        )
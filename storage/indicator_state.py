@@ -0,0 +1,63 @@
+import os
+import pickle
+
+
+class IndicatorState:
+    """
+    Сохраненное состояние онлайн-индикаторов по каждой бумаге
+    
+    Для каждой SECID хранится состояние StreamingIndicators (последние
+    значения окон, накопленные EMA) и последняя обработанная TRADEDATE.
+    Этого достаточно, чтобы досчитать индикаторы только для новых строк,
+    не перечитывая историю. Состояние действительно только для того же
+    набора индикаторов, с которым оно было построено.
+    """
+    
+    def __init__(self, path='data/.indicator_state.pkl'):
+        self.path = path
+        self.state = self._load()
+    
+    def _load(self):
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'rb') as f:
+                return pickle.load(f)
+        return {'indicators': None, 'watermarks': {}, 'states': {}}
+    
+    @property
+    def watermarks(self):
+        return self.state['watermarks']
+    
+    @property
+    def states(self):
+        return self.state['states']
+    
+    def matches(self, indicators):
+        """Построено ли состояние для этого набора индикаторов"""
+        return bool(self.state['watermarks']) and self.state['indicators'] == list(indicators)
+    
+    def update(self, indicators, states, watermarks):
+        """Заменить состояние (в памяти; на диск - через save)"""
+        self.state = {
+            'indicators': list(indicators),
+            'watermarks': dict(watermarks),
+            'states': states,
+        }
+    
+    def save(self):
+        """Атомарно записать состояние на диск"""
+        if not self.path:
+            return
+        
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(self.state, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.path)
+    
+    def clear(self):
+        self.state = {'indicators': None, 'watermarks': {}, 'states': {}}
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,582 @@
+import glob
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+
+# Колонки ISS, которые хранятся как текст и целые числа;
+# TRADEDATE - дата, все остальные колонки - float64
+TEXT_COLUMNS = {'BOARDID', 'SHORTNAME', 'SECID', 'CURRENCYID', 'TRADE_SESSION_DATE'}
+INT_COLUMNS = {'VOLUME', 'NUMTRADES'}
+
+
+def normalize_types(df):
+    """
+    Привести колонки к фиксированным типам
+    
+    Страницы ISS с пустыми значениями приходят как object-колонки из None,
+    поэтому типы задаются по имени колонки, а не выводятся из данных:
+    так у всех файлов датасета одинаковая схема.
+    """
+    df = df.copy()
+    
+    for col in df.columns:
+        if col == 'TRADEDATE':
+            df[col] = pd.to_datetime(df[col])
+        elif col in TEXT_COLUMNS:
+            df[col] = df[col].astype('string')
+        elif col in INT_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+        elif not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    
+    return df
+
+
+# Текстовые колонки с малым числом различных значений
+CATEGORY_COLUMNS = ['SECID', 'BOARDID']
+
+
+def compact_types(df):
+    """
+    Компактные типы для обработки в памяти
+    
+    SECID и BOARDID - категории с отсортированным списком значений
+    (сортировка по коду совпадает с сортировкой по строке), целые колонки
+    без пропусков - наименьший подходящий целый тип, float64 - float32,
+    только если все значения представимы в float32 без потерь.
+    """
+    df = df.copy()
+    
+    for col in df.columns:
+        values = df[col]
+        if col in CATEGORY_COLUMNS:
+            categories = sorted(values.dropna().unique())
+            df[col] = values.astype(pd.CategoricalDtype(categories))
+        elif col in INT_COLUMNS and pd.api.types.is_numeric_dtype(values) and not values.isna().any():
+            downcast = 'unsigned' if len(values) and values.min() >= 0 else 'integer'
+            df[col] = pd.to_numeric(values.astype('int64'), downcast=downcast)
+        elif values.dtype == 'float64':
+            narrow = values.to_numpy().astype('float32')
+            if np.array_equal(narrow.astype('float64'), values.to_numpy(), equal_nan=True):
+                df[col] = narrow
+    
+    return df
+
+
+def read_security_files(files, data_dir, schema, columns, filter=None, index=None):
+    """
+    Прочитать файлы одной бумаги в pandas, по возрастанию TRADEDATE
+    
+    index: колонка, которая становится индексом (None - индекс по порядку)
+    """
+    dataset = ds.dataset(
+        files,
+        schema=schema,
+        format='parquet',
+        partitioning=ParquetStore.PARTITIONING,
+        partition_base_dir=data_dir
+    )
+    df = dataset.to_table(columns=columns, filter=filter).to_pandas(ignore_metadata=True)[columns]
+    
+    if 'TRADEDATE' in df.columns:
+        df = df.sort_values('TRADEDATE', kind='stable').reset_index(drop=True)
+    if index is not None:
+        df = df.set_index(index)
+    return df
+
+
+class ParquetStore:
+    """
+    Parquet-датасет, партиционированный по SECID и году
+    
+    Раскладка: root/SECID=SBER/YEAR=2024/part-<id>.parquet. Запись добавляет
+    новые файлы в партиции, чтение отбирает только нужные колонки, а фильтры
+    по бумагам и датам отсекают лишние партиции и row group'ы.
+    
+    Полная перезапись идет в новую версию root/v-<id>/SECID=.../...,
+    которая становится видимой атомарной заменой манифеста root/_manifest.json.
+    Пока версия пишется, читатели видят предыдущую целиком. Upsert и замена
+    диапазона тоже пишут новую версию: переписанные партиции - новыми
+    файлами, а на файлы остальных ставятся жесткие ссылки.
+    """
+    
+    MANIFEST = '_manifest.json'
+    PARTITION_COLS = ['SECID', 'YEAR']
+    PARTITIONING = ds.partitioning(
+        pa.schema([('SECID', pa.string()), ('YEAR', pa.int32())]),
+        flavor='hive'
+    )
+    
+    def __init__(self, root):
+        self.root = root
+    
+    def exists(self):
+        return bool(self.files())
+    
+    def manifest(self):
+        """Манифест текущей версии или None (датасет без версий)"""
+        path = os.path.join(self.root, self.MANIFEST)
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    
+    @property
+    def data_dir(self):
+        """Каталог с партициями текущей версии"""
+        manifest = self.manifest()
+        if manifest is None:
+            return self.root
+        return os.path.join(self.root, manifest['version'])
+    
+    def new_version(self):
+        """
+        Каталог для новой версии датасета
+        
+        Версия не видна читателям, пока не вызван commit().
+        """
+        version = f"v-{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(self.root, version)
+        os.makedirs(path, exist_ok=True)
+        return path
+    
+    def commit(self, version_dir, files=None, rows=None):
+        """
+        Сделать версию текущей: атомарная замена манифеста
+        
+        Предыдущая версия сохраняется (ее могут дочитывать). Удаляются только
+        версии старше предыдущей (по времени создания в имени) и версия,
+        предыдущая для нее по манифесту: каталоги новее предыдущей версии
+        могут еще писаться другими задачами и не трогаются.
+        files: файлы версии; rows: число строк (по умолчанию - из метаданных files)
+        """
+        previous = self.manifest()
+        version = os.path.basename(os.path.normpath(version_dir))
+        files = list(files or [])
+        if rows is None:
+            rows = sum(pq.read_metadata(path).num_rows for path in files)
+        
+        manifest = {
+            'version': version,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'files': sorted(os.path.relpath(path, version_dir) for path in files),
+            'rows': rows,
+            'previous': previous['version'] if previous else None,
+        }
+        
+        tmp_path = os.path.join(self.root, f".{self.MANIFEST}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(tmp_path, os.path.join(self.root, self.MANIFEST))
+        
+        if previous is None:
+            # Переход с датасета без версий: его партиции лежат в корне
+            stale = {name for name in os.listdir(self.root) if name.startswith('SECID=')}
+        else:
+            created = self._version_time(previous['version'])
+            stale = {
+                name for name in os.listdir(self.root)
+                if name.startswith('v-') and self._version_time(name) < created
+            }
+            if previous.get('previous'):
+                stale.add(previous['previous'])
+        
+        for name in stale - {version, previous['version'] if previous else None}:
+            path = os.path.join(self.root, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        
+        return manifest
+    
+    @staticmethod
+    def _version_time(name):
+        """Время создания версии из имени v-<время>-<id>"""
+        return name.split('-')[1]
+    
+    def files(self, secid=None, year=None):
+        """Файлы датасета, при необходимости только одной партиции"""
+        pattern = os.path.join(
+            self.data_dir,
+            f"SECID={secid}" if secid is not None else 'SECID=*',
+            f"YEAR={year}" if year is not None else 'YEAR=*',
+            '*.parquet'
+        )
+        return sorted(glob.glob(pattern))
+    
+    def security_files(self, secids=None):
+        """
+        Файлы бумаг secids (None - все файлы датасета)
+        
+        Просматриваются только каталоги этих бумаг, поэтому чтение не
+        задевает партиции, которые в это же время пишутся другими задачами.
+        """
+        if secids is None:
+            return self.files()
+        return sorted(path for secid in {str(s) for s in secids} for path in self.files(secid))
+    
+    def fingerprint(self, secids=None):
+        """
+        Отпечаток данных бумаг secids (None - всего датасета) без чтения данных
+        
+        Хэш путей внутри версии, размеров и времени изменения файлов: файлы
+        пишутся атомарно и на месте не меняются, а в новую версию переходят
+        жесткими ссылками, поэтому отпечаток меняется вместе с данными и только
+        у тех бумаг, чьи партиции изменились.
+        """
+        return self._fingerprint(self.security_files(secids))
+    
+    def fingerprints(self):
+        """Отпечатки всех партиций датасета по одному просмотру файлов: {(SECID, YEAR): отпечаток}"""
+        return {key: self._fingerprint(files) for key, files in sorted(self.partitions().items())}
+    
+    def _fingerprint(self, files):
+        data_dir = self.data_dir
+        digest = hashlib.sha256()
+        for path in files:
+            stat = os.stat(path)
+            relative = os.path.relpath(path, data_dir)
+            digest.update(f"{relative}:{stat.st_size}:{stat.st_mtime_ns}\n".encode('utf-8'))
+        return digest.hexdigest()
+    
+    def partitions(self, secids=None):
+        """Файлы датасета по партициям: {(SECID, YEAR): [путь, ...]}"""
+        result = {}
+        for path in self.security_files(secids):
+            year_dir = os.path.dirname(path)
+            secid = os.path.basename(os.path.dirname(year_dir)).split('=', 1)[1]
+            year = int(os.path.basename(year_dir).split('=', 1)[1])
+            result.setdefault((secid, year), []).append(path)
+        return result
+    
+    def _partition_dir(self, secid, year):
+        return os.path.join(self.data_dir, f"SECID={secid}", f"YEAR={year}")
+    
+    def _write_partition(self, df, secid, year, name=None):
+        """Записать один файл в партицию (SECID, YEAR)"""
+        directory = self._partition_dir(secid, year)
+        os.makedirs(directory, exist_ok=True)
+        
+        path = os.path.join(directory, name or f"part-{uuid.uuid4().hex}.parquet")
+        table = pa.Table.from_pandas(
+            df.drop(columns=self.PARTITION_COLS, errors='ignore'),
+            preserve_index=False
+        )
+        
+        # Скрытый временный файл не виден при чтении датасета
+        tmp_path = os.path.join(directory, f".{os.path.basename(path)}.tmp")
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+        return path
+    
+    @staticmethod
+    def _partitions(df):
+        df = normalize_types(df)
+        years = df['TRADEDATE'].dt.year
+        return df.groupby([df['SECID'], years], sort=True)
+    
+    def append(self, df, name=None):
+        """
+        Добавить строки новыми файлами в соответствующие партиции
+        
+        name: имя файла; повторная запись с тем же именем заменяет файл,
+        поэтому повтор записи той же порции данных идемпотентен
+        """
+        if df.empty:
+            return []
+        
+        return [
+            self._write_partition(part.sort_values('TRADEDATE'), secid, year, name)
+            for (secid, year), part in self._partitions(df)
+        ]
+    
+    def upsert(self, df, keys=('SECID', 'TRADEDATE')):
+        """
+        Слить строки с датасетом по ключу keys (новые строки побеждают)
+        
+        Переписываются только партиции, в которые попали новые строки;
+        результат публикуется новой версией (см. _rewrite).
+        """
+        if df.empty:
+            return []
+        
+        parts = {}
+        for (secid, year), part in self._partitions(df):
+            if self.files(secid, year):
+                existing = self.read(secids=[secid], years=[year])
+                part = pd.concat([normalize_types(existing), part], ignore_index=True)
+            parts[(secid, year)] = part.drop_duplicates(subset=list(keys), keep='last')
+        
+        return self._rewrite(parts)
+    
+    def replace_range(self, df, secids, start):
+        """
+        Заменить строки бумаг secids с TRADEDATE >= start строками df
+        
+        Переписываются только партиции этих бумаг за годы начиная с start;
+        результат публикуется новой версией (см. _rewrite).
+        Нужно, когда ключи новых строк могут не совпасть со старыми
+        (например, метка периода сдвинулась после добавления дня).
+        """
+        start = pd.Timestamp(start)
+        new_parts = {key: part for key, part in self._partitions(df)} if not df.empty else {}
+        
+        touched = {key for key in self.partitions() if key[0] in set(secids) and key[1] >= start.year}
+        touched |= set(new_parts)
+        
+        parts = {}
+        for secid, year in sorted(touched):
+            frames = []
+            if self.files(secid, year):
+                existing = normalize_types(self.read(secids=[secid], years=[year]))
+                frames.append(existing[existing['TRADEDATE'] < start])
+            if (secid, year) in new_parts:
+                frames.append(new_parts[(secid, year)])
+            parts[(secid, year)] = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        
+        return self._rewrite(parts)
+    
+    def _rewrite(self, parts):
+        """
+        Опубликовать новую версию, в которой партиции parts заменены
+        
+        parts: {(SECID, YEAR): фрейм}; пустой фрейм - партиция удаляется.
+        Файлы остальных партиций не копируются: в новой версии на них ставятся
+        жесткие ссылки (копия - если ссылки не поддерживаются). Читатели
+        видят прежнюю версию целиком, пока не заменен манифест.
+        Возвращает записанные файлы.
+        """
+        current = self.partitions()
+        data_dir = self.data_dir
+        version_dir = self.new_version()
+        version = ParquetStore(version_dir)
+        
+        files = []
+        for key, paths in current.items():
+            if key in parts:
+                continue
+            for path in paths:
+                target = os.path.join(version_dir, os.path.relpath(path, data_dir))
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                try:
+                    os.link(path, target)
+                except OSError:
+                    shutil.copy2(path, target)
+                files.append(target)
+        
+        written = [
+            version._write_partition(part.sort_values('TRADEDATE'), secid, year)
+            for (secid, year), part in sorted(parts.items()) if not part.empty
+        ]
+        
+        # Число строк - из манифеста с поправкой на замененные партиции,
+        # если в манифесте все текущие файлы (иначе commit пересчитает)
+        manifest = self.manifest()
+        rows = None
+        if manifest is not None and len(manifest['files']) == sum(len(paths) for paths in current.values()):
+            replaced = [path for key in parts for path in current.get(key, [])]
+            rows = (manifest['rows'] - sum(pq.read_metadata(path).num_rows for path in replaced)
+                    + sum(len(part) for part in parts.values()))
+        
+        self.commit(version_dir, files=files + written, rows=rows)
+        return written
+    
+    def compact(self, secid, year, keys=('SECID', 'TRADEDATE')):
+        """
+        Слить файлы партиции в один
+        
+        При повторе ключа остается строка из более нового файла.
+        """
+        files = sorted(self.files(secid, year), key=os.path.getmtime)
+        if len(files) <= 1:
+            return files
+        
+        parts = []
+        for path in files:
+            part = pq.read_table(path).to_pandas(ignore_metadata=True)
+            part['SECID'] = secid
+            parts.append(normalize_types(part))
+        
+        df = pd.concat(parts, ignore_index=True)
+        df = df.drop_duplicates(subset=list(keys), keep='last').sort_values('TRADEDATE')
+        path = self._write_partition(df, secid, year)
+        
+        for old_path in files:
+            os.remove(old_path)
+        
+        return [path]
+    
+    def overwrite(self, df):
+        """Заменить содержимое датасета (новой версией)"""
+        version_dir = self.new_version()
+        files = ParquetStore(version_dir).append(df)
+        self.commit(version_dir, files=files, rows=len(df))
+        return files
+    
+    def schema(self, files=None):
+        """Общая схема файлов (файлы могут отличаться набором колонок)"""
+        schemas = [pq.read_schema(path) for path in (self.files() if files is None else files)]
+        fields = [pa.field('SECID', pa.string()), pa.field('YEAR', pa.int32())]
+        return pa.unify_schemas(schemas + [pa.schema(fields)])
+    
+    def columns(self, schema=None):
+        """Колонки данных (служебная YEAR не входит)"""
+        schema = self.schema() if schema is None else schema
+        names = [name for name in schema.names if name not in self.PARTITION_COLS]
+        return ['SECID'] + names
+    
+    def dataset(self, secids=None, schema=None, files=None):
+        """
+        Датасет pyarrow по файлам бумаг secids (None - всем)
+        
+        schema: уже прочитанная общая схема этих файлов (иначе читается заново)
+        files: готовый список файлов датасета вместо файлов бумаг secids
+        """
+        files = self.security_files(secids) if files is None else files
+        return ds.dataset(
+            files,
+            schema=self.schema(files) if schema is None else schema,
+            format='parquet',
+            partitioning=self.PARTITIONING,
+            partition_base_dir=self.data_dir
+        )
+    
+    def count_rows(self, secids=None, start=None, end=None):
+        """Число строк по метаданным Parquet (данные не читаются)"""
+        if not self.exists():
+            return 0
+        if start is None and end is None:
+            # Без фильтра по датам общая схема не нужна: строки файлов из их метаданных
+            return sum(pq.read_metadata(path).num_rows for path in self.security_files(secids))
+        return self.dataset(secids).count_rows(filter=self.filter_expression(secids, start, end))
+    
+    @staticmethod
+    def filter_expression(secids=None, start=None, end=None, years=None):
+        """Фильтр pyarrow по бумагам, датам и годам (для отсечения партиций)"""
+        conditions = []
+        
+        if secids is not None:
+            conditions.append(ds.field('SECID').isin([str(s) for s in secids]))
+        if years is not None:
+            conditions.append(ds.field('YEAR').isin([int(y) for y in years]))
+        if start is not None:
+            start = pd.Timestamp(start)
+            conditions.append(ds.field('TRADEDATE') >= start)
+            conditions.append(ds.field('YEAR') >= start.year)
+        if end is not None:
+            end = pd.Timestamp(end)
+            conditions.append(ds.field('TRADEDATE') <= end)
+            conditions.append(ds.field('YEAR') <= end.year)
+        
+        if not conditions:
+            return None
+        
+        expression = conditions[0]
+        for condition in conditions[1:]:
+            expression = expression & condition
+        return expression
+    
+    def read(self, columns=None, secids=None, start=None, end=None, years=None):
+        """
+        Прочитать датасет в pandas
+        
+        columns: нужные колонки (None - все, кроме служебной YEAR)
+        secids, start, end, years: фильтры, проталкиваемые в pyarrow
+        Версия определяется один раз: commit во время чтения не смешает
+        файлы разных версий.
+        """
+        snapshot = ParquetStore(self.data_dir)
+        files = snapshot.security_files(secids)
+        if not files:
+            return pd.DataFrame(columns=columns or [])
+        
+        schema = snapshot.schema(files)
+        if columns is None:
+            columns = snapshot.columns(schema)
+        
+        dataset = ds.dataset(
+            files,
+            schema=schema,
+            format='parquet',
+            partitioning=self.PARTITIONING,
+            partition_base_dir=snapshot.root
+        )
+        table = dataset.to_table(
+            columns=list(columns),
+            filter=self.filter_expression(secids, start, end, years)
+        )
+        # Без pandas-метаданных: обычные numpy-типы вместо Int64/string
+        df = table.to_pandas(ignore_metadata=True)[list(columns)]
+        
+        sort_cols = [col for col in ['SECID', 'TRADEDATE'] if col in df.columns]
+        if sort_cols:
+            df = df.sort_values(sort_cols, kind='stable').reset_index(drop=True)
+        
+        return df
+    
+    def read_dask(self, columns=None, secids=None, start=None, end=None, index='SECID'):
+        """
+        Прочитать датасет в Dask: одна партиция на бумагу
+        
+        Партиции строятся по раскладке каталогов SECID=...: данные при этом
+        не читаются, все строки бумаги (за все годы) попадают в одну
+        партицию и отсортированы по TRADEDATE, а бумаги идут по порядку
+        SECID. Дедупликация, сортировка, индикаторы и агрегаты по бумагам
+        выполняются внутри партиций без перераспределения данных.
+        
+        index: 'SECID' - SECID становится индексом с известными границами
+               партиций (divisions), и groupby/join по SECID в Dask идут
+               без перераспределения; None - SECID остается колонкой
+        Схема берется только из файлов выбранных бумаг, версия - одна на
+        весь вызов.
+        """
+        import dask.dataframe as dd
+        
+        snapshot = ParquetStore(self.data_dir)
+        by_security = {}
+        for (secid, _), files in sorted(snapshot.partitions(secids).items()):
+            by_security.setdefault(secid, []).extend(files)
+        
+        if not by_security:
+            # Ни одной партиции выбранных бумаг - пустой фрейм без партиций данных
+            meta = pd.DataFrame(columns=list(columns or ['SECID']))
+            return dd.from_pandas(meta.set_index(index) if index is not None else meta, npartitions=1)
+        
+        selected = [path for files in by_security.values() for path in files]
+        schema = snapshot.schema(selected)
+        if columns is None:
+            columns = snapshot.columns(schema)
+        columns = list(columns)
+        if index is not None and index not in columns:
+            columns = [index] + columns
+        
+        meta = schema.empty_table().select(columns).to_pandas(ignore_metadata=True)
+        if index is not None:
+            meta = meta.set_index(index)
+        
+        # Партиция на бумагу: границы - сами SECID по порядку
+        secid_list = list(by_security)
+        divisions = tuple(secid_list) + (secid_list[-1],) if index == 'SECID' else None
+        
+        return dd.from_map(
+            read_security_files,
+            list(by_security.values()),
+            data_dir=snapshot.root,
+            schema=schema,
+            columns=columns,
+            filter=self.filter_expression(start=start, end=end),
+            index=index,
+            meta=meta,
+            divisions=divisions,
+            label='read-security',
+            enforce_metadata=False
+        )
@@ -0,0 +1,113 @@
+import pandas as pd
+
+from storage.parquet_store import ParquetStore
+
+
+class RawDataStore:
+    """
+    Хранилище сырых данных торгов
+    
+    Данные лежат в Parquet-датасете, партиционированном по SECID и году.
+    Строки уникальны по (SECID, TRADEDATE): новые данные объединяются
+    с уже сохраненными по принципу upsert, а последняя сохраненная дата
+    по каждой бумаге служит отметкой (watermark) для инкрементальной загрузки.
+    """
+    
+    KEYS = ['SECID', 'TRADEDATE']
+    
+    def __init__(self, path='data/moex_raw'):
+        self.path = path
+        self.store = ParquetStore(path)
+    
+    def exists(self):
+        return self.store.exists()
+    
+    def load(self, columns=None, secids=None, start=None, end=None):
+        """Прочитать сохраненные данные (с отбором колонок и фильтрами)"""
+        return self.store.read(columns=columns, secids=secids, start=start, end=end)
+    
+    def watermarks(self):
+        """Последняя сохраненная TRADEDATE по каждой бумаге: {SECID: Timestamp}"""
+        if not self.exists():
+            return {}
+        
+        df = self.store.read(columns=self.KEYS)
+        if df.empty:
+            return {}
+        
+        return df.groupby('SECID')['TRADEDATE'].max().to_dict()
+    
+    def securities(self, secids=None):
+        """Бумаги, по которым есть данные (из secids, если задан)"""
+        return sorted({secid for secid, _ in self.store.partitions(secids)})
+    
+    def load_new(self, watermarks, columns=None, secids=None):
+        """
+        Строки новее watermark своей бумаги: {SECID: Timestamp}
+        
+        Бумаги без watermark читаются целиком. Для известных бумаг в pyarrow
+        проталкивается фильтр по самой ранней отметке, поэтому старые
+        партиции (годы) не читаются. secids - только эти бумаги.
+        """
+        secids = self.securities(secids)
+        known = [s for s in secids if s in watermarks]
+        new = [s for s in secids if s not in watermarks]
+        
+        parts = []
+        if known:
+            start = min(watermarks[s] for s in known) + pd.Timedelta(days=1)
+            parts.append(self.load(columns=columns, secids=known, start=start))
+        if new:
+            parts.append(self.load(columns=columns, secids=new))
+        
+        if not parts:
+            return self.load(columns=columns, secids=secids)
+        
+        df = pd.concat(parts, ignore_index=True)
+        cutoff = df['SECID'].map(watermarks).fillna(pd.Timestamp.min)
+        return df[df['TRADEDATE'] > cutoff].reset_index(drop=True)
+    
+    def upsert(self, df):
+        """
+        Объединить новые строки с хранилищем
+        
+        При совпадении (SECID, TRADEDATE) побеждает новая строка.
+        Переписываются только затронутые партиции (SECID, год).
+        Возвращает число записанных новых строк.
+        """
+        if df.empty:
+            return 0
+        
+        self.store.upsert(df, keys=self.KEYS)
+        return len(df)
+    
+    def write_page(self, df, name):
+        """
+        Потоковая запись одной страницы данных
+        
+        name однозначно определяет страницу, поэтому повторная запись
+        после сбоя перезаписывает тот же файл. Потокобезопасно.
+        """
+        if df.empty:
+            return
+        
+        self.store.append(df, name=f"page-{name}.parquet")
+    
+    def finalize(self, secids=None):
+        """
+        Слить постраничные файлы в партициях, где их больше одного
+        
+        В памяти одновременно находится только одна партиция (SECID, год).
+        Подхватываются и страницы, записанные до сбоя предыдущего запуска.
+        secids - только партиции этих бумаг (остальные могут дописываться
+        параллельно).
+        """
+        compacted = 0
+        for (secid, year), files in sorted(self.store.partitions(secids).items()):
+            if len(files) < 2:
+                continue
+            
+            self.store.compact(secid, year, keys=self.KEYS)
+            compacted += 1
+        
+        return compacted